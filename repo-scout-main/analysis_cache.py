@@ -0,0 +1,100 @@
+import json
+import time
+
+from git import Git
+
+from line_counter import COUNTER_VERSION
+from sqlite_connection import connect
+
+# Results of count_lines_of_code keyed by clone URL and commit SHA, so unchanged repositories are not cloned again.
+# Entries written by another COUNTER_VERSION are treated as missing.
+DEFAULT_CACHE_PATH = "analysis_cache.db"
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_MAX_AGE_SECONDS = 30 * 24 * 60 * 60
+LS_REMOTE_TIMEOUT_SECONDS = 30
+
+
+def normalize_repo_url(repo_url):
+    # html_url and clone_url of the same repository share one cache entry
+    repo_url = repo_url.rstrip("/")
+    if repo_url.endswith(".git"):
+        repo_url = repo_url[:-len(".git")]
+    return repo_url
+
+
+def get_remote_head_sha(repo_url, timeout=LS_REMOTE_TIMEOUT_SECONDS):
+    # Asks the remote for its HEAD commit without cloning anything
+    output = Git().ls_remote(repo_url, "HEAD", kill_after_timeout=timeout)
+    if not output:
+        return None
+    return output.split()[0]
+
+
+class AnalysisCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES, max_age_seconds=DEFAULT_MAX_AGE_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS line_counts ("
+                " repo_url TEXT NOT NULL,"
+                " commit_sha TEXT NOT NULL,"
+                " line_counts TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_used_at REAL NOT NULL,"
+                " PRIMARY KEY (repo_url, commit_sha))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS line_counts_last_used_at ON line_counts (last_used_at)")
+
+    def _connect(self):
+        return connect(self.path)
+
+    def get(self, repo_url, commit_sha):
+        repo_url = normalize_repo_url(repo_url)
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT line_counts, created_at FROM line_counts WHERE repo_url = ? AND commit_sha = ?",
+                (repo_url, commit_sha)
+            ).fetchone()
+            if row is None:
+                return None
+            line_counts, created_at = row
+            if now - created_at > self.max_age_seconds:
+                conn.execute("DELETE FROM line_counts WHERE repo_url = ? AND commit_sha = ?", (repo_url, commit_sha))
+                return None
+            conn.execute(
+                "UPDATE line_counts SET last_used_at = ? WHERE repo_url = ? AND commit_sha = ?",
+                (now, repo_url, commit_sha)
+            )
+        entry = json.loads(line_counts)
+        if entry.get("counter_version") != COUNTER_VERSION:
+            return None
+        return entry["line_counts"]
+
+    def put(self, repo_url, commit_sha, line_counts):
+        repo_url = normalize_repo_url(repo_url)
+        now = time.time()
+        with self._connect() as conn:
+            # Only the newest commit of a repository is worth keeping
+            conn.execute("DELETE FROM line_counts WHERE repo_url = ? AND commit_sha != ?", (repo_url, commit_sha))
+            conn.execute(
+                "INSERT OR REPLACE INTO line_counts (repo_url, commit_sha, line_counts, created_at, last_used_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (repo_url, commit_sha, json.dumps({"counter_version": COUNTER_VERSION, "line_counts": line_counts}), now, now)
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM line_counts WHERE created_at < ?", (now - self.max_age_seconds,))
+        conn.execute(
+            "DELETE FROM line_counts WHERE rowid IN ("
+            " SELECT rowid FROM line_counts ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM line_counts")
+
@@ -0,0 +1,211 @@
+import os
+import shutil
+import threading
+import time
+
+import pandas as pd
+from git import Git, Repo
+
+import line_counter
+from incremental_analysis import save_file_counts
+from metrics import BYTES_CLONED, CLONE, PERSIST, REPOSITORIES_FAILED, RunMetrics, directory_size
+from repo_analysis import build_detailed_analysis_result, timed_count
+from sqlite_connection import connect
+
+# Persistent queue for the favourites' advanced analysis. Jobs live in SQLite and are run by background
+# worker threads, so progress survives browser disconnects, and jobs interrupted by a server restart are
+# queued again on the next start. Each finished repository is written to the advanced favourites at once.
+# Stage timings of every job are added to metrics, which lives as long as the queue. Every file is counted,
+# also when the cache knows the repository, so the per-file breakdown can be saved next to the clone.
+DEFAULT_QUEUE_PATH = "analysis_queue.db"
+DEFAULT_QUEUE_WORKERS = 2
+DEFAULT_MAX_ATTEMPTS = 3
+CLONE_TIMEOUT_SECONDS = 600
+# A failed attempt is retried after RETRY_DELAY_SECONDS times the number of attempts so far
+RETRY_DELAY_SECONDS = 30
+# How long an idle worker sleeps before looking for new jobs, unless woken by enqueue
+IDLE_POLL_SECONDS = 5
+
+QUEUED = "queued"
+CLONING = "cloning"
+COUNTING = "counting"
+DONE = "done"
+FAILED = "failed"
+ACTIVE_STATUSES = (QUEUED, CLONING, COUNTING)
+
+
+class AnalysisQueue:
+    def __init__(self, store, cache=None, path=DEFAULT_QUEUE_PATH, workers=DEFAULT_QUEUE_WORKERS,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, clone_timeout=CLONE_TIMEOUT_SECONDS,
+                 clone_base_dir="./temp_cloned_repos", favorites_repos_dir="./favorites_repos", metrics=None):
+        self.store = store
+        self.metrics = metrics if metrics is not None else RunMetrics()
+        self.cache = cache
+        self.path = path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.clone_timeout = clone_timeout
+        self.clone_base_dir = clone_base_dir
+        self.favorites_repos_dir = favorites_repos_dir
+
+        self._threads = []
+        self._lock = threading.Lock()
+        # Held while a job saves its result, so remove never runs halfway through that
+        self._persist_lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " name TEXT PRIMARY KEY,"
+                " url TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " message TEXT,"
+                " not_before REAL NOT NULL DEFAULT 0,"
+                " updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+
+    def _connect(self):
+        return connect(self.path)
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            # Jobs a previous server process was running when it stopped
+            with self._connect() as conn:
+                conn.execute(
+                    f"UPDATE jobs SET status = ?, updated_at = ? WHERE status IN ('{CLONING}', '{COUNTING}')",
+                    (QUEUED, time.time())
+                )
+            for _ in range(self.workers):
+                thread = threading.Thread(target=self._work, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def enqueue(self, favorites_df):
+        # Queues a job per Name/URL row; rows that are already queued or running are left alone
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO jobs (name, url, status, attempts, message, not_before, updated_at)"
+                " VALUES (?, ?, ?, 0, NULL, 0, ?)"
+                " ON CONFLICT (name) DO UPDATE SET url = excluded.url, status = excluded.status, attempts = 0,"
+                " message = NULL, not_before = 0, updated_at = excluded.updated_at"
+                f" WHERE jobs.status NOT IN ('{QUEUED}', '{CLONING}', '{COUNTING}')",
+                [(name, url, QUEUED, now) for name, url in zip(favorites_df['Name'], favorites_df['URL'])]
+            )
+        self._wakeup.set()
+
+    def remove(self, names):
+        # A job that is still cloning or counting discards its result. One that is saving it is waited
+        # for, so afterwards the caller can delete its advanced row and clone.
+        with self._persist_lock, self._connect() as conn:
+            conn.executemany("DELETE FROM jobs WHERE name = ?", [(name,) for name in names])
+
+    def clear_finished(self):
+        with self._connect() as conn:
+            conn.execute(f"DELETE FROM jobs WHERE status IN ('{DONE}', '{FAILED}')")
+
+    def jobs(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT name, url, status, attempts, message, updated_at FROM jobs ORDER BY rowid").fetchall()
+        df = pd.DataFrame(rows, columns=["Name", "URL", "Status", "Attempts", "Message", "Updated At"])
+        df["Updated At"] = pd.to_datetime(df["Updated At"], unit="s")
+        return df
+
+    def active_names(self):
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT name FROM jobs WHERE status IN ('{QUEUED}', '{CLONING}', '{COUNTING}')").fetchall()
+        return [name for (name,) in rows]
+
+    def has_active_jobs(self):
+        with self._connect() as conn:
+            return conn.execute(
+                f"SELECT 1 FROM jobs WHERE status IN ('{QUEUED}', '{CLONING}', '{COUNTING}') LIMIT 1"
+            ).fetchone() is not None
+
+    def _claim(self):
+        # Marks the oldest runnable job as cloning and returns it, or None if there is nothing to do
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            job = conn.execute(
+                "SELECT name, url, attempts FROM jobs WHERE status = ? AND not_before <= ? ORDER BY rowid LIMIT 1",
+                (QUEUED, time.time())
+            ).fetchone()
+            if job is not None:
+                conn.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE name = ?", (CLONING, time.time(), job[0]))
+        return job
+
+    def _update(self, name, status, attempts=None, message=None, not_before=0):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, attempts = COALESCE(?, attempts), message = ?, not_before = ?, updated_at = ?"
+                " WHERE name = ?",
+                (status, attempts, message, not_before, time.time(), name)
+            )
+            return cursor.rowcount > 0
+
+    def _work(self):
+        while True:
+            try:
+                job = self._claim()
+            except Exception:
+                job = None
+            if job is None:
+                self._wakeup.wait(IDLE_POLL_SECONDS)
+                self._wakeup.clear()
+                continue
+            self._run(*job)
+
+    def _run(self, name, url, attempts):
+        attempts += 1
+        clone_dir = os.path.join(self.clone_base_dir, name)
+        file_errors = []
+        file_counts = {}
+
+        count_lines = timed_count(lambda directory: line_counter.count_lines_of_code(
+            directory, on_error=lambda file_path, message: file_errors.append(file_path), file_counts=file_counts
+        ), url, self.metrics)
+
+        try:
+            shutil.rmtree(clone_dir, ignore_errors=True)
+            os.makedirs(self.clone_base_dir, exist_ok=True)
+            with self.metrics.timer(CLONE, url):
+                Git().clone("--depth", "1", "--", url, clone_dir, kill_after_timeout=self.clone_timeout)
+            self.metrics.increment(BYTES_CLONED, directory_size(clone_dir), url)
+
+            if not self._update(name, COUNTING, attempts):
+                shutil.rmtree(clone_dir, ignore_errors=True)
+                return  # Removed from the queue while cloning
+            line_counts = count_lines(clone_dir)
+            commit_sha = Repo(clone_dir).head.commit.hexsha
+            if self.cache is not None:
+                self.cache.put(url, commit_sha, line_counts)
+
+            with self._persist_lock:
+                if not self._update(name, COUNTING, attempts):
+                    shutil.rmtree(clone_dir, ignore_errors=True)
+                    return  # Removed from the queue while counting
+
+                # Checkpoint: the result is saved before the job is marked done, so a crash in between only repeats it
+                with self.metrics.timer(PERSIST, url):
+                    self.store.upsert_advanced(pd.DataFrame([build_detailed_analysis_result(name, line_counts)]))
+                final_repo_dir = os.path.join(self.favorites_repos_dir, name)
+                os.makedirs(self.favorites_repos_dir, exist_ok=True)
+                if os.path.exists(final_repo_dir):
+                    shutil.rmtree(final_repo_dir)
+                shutil.move(clone_dir, final_repo_dir)
+                save_file_counts(final_repo_dir, commit_sha, file_counts)
+
+            message = f"Could not read {len(file_errors)} files" if file_errors else None
+            self._update(name, DONE, attempts, message)
+        except Exception as e:
+            shutil.rmtree(clone_dir, ignore_errors=True)
+            if attempts < self.max_attempts:
+                self._update(name, QUEUED, attempts, f"Attempt {attempts} failed: {e}", time.time() + RETRY_DELAY_SECONDS * attempts)
+            else:
+                self.metrics.increment(REPOSITORIES_FAILED, repository=url)
+                self._update(name, FAILED, attempts, str(e))
@@ -1,105 +1,98 @@
+import math
 import os
 import shutil
+import threading
 import pandas as pd
 import streamlit as st
 import requests
-from git import Repo
 from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode, DataReturnMode
-from io import StringIO
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+import csv_loader
+import file_breakdown
+import repo_analysis
+from github_client import GitHubSearchError
+from page_prefetcher import PagePrefetcher
+from result_cache import ResultCache
+from favorites_store import FAVORITES_COLUMNS, FavoritesStore, update_favorites
+from analysis_cache import AnalysisCache, normalize_repo_url
+from analysis_queue import AnalysisQueue, DONE, FAILED
+from incremental_analysis import file_counts_path, refresh_repository, remove_file_counts
+from metrics import PERSIST, RunMetrics
+from repo_analysis import DEFAULT_ANALYSIS_WORKERS, build_detailed_analysis_result, fill_language_columns
+
+FAVORITES_CSV = "favorites.csv"
+ADVANCED_FAVORITES_CSV = "advanced_favorites.csv"
+MAX_REPORTED_BAD_LINES = 20
+
+# Upper bound for the number of repositories cloned and counted at the same time during detailed analysis
+MAX_ANALYSIS_WORKERS = 16
+# Seconds between refreshes of the advanced analysis queue status on the Favorites page
+QUEUE_POLL_SECONDS = 2
+# Search results and basic analysis rows are reused for SEARCH_CACHE_SECONDS, line counts for LINE_COUNT_CACHE_SECONDS
+SEARCH_CACHE_SECONDS = 10 * 60
+LINE_COUNT_CACHE_SECONDS = 60 * 60
+RESULT_CACHE_PATH = "result_cache.db"
+FILE_BREAKDOWN_CACHE_BYTES = 256 << 20
+# Rows per page of the favourites and advanced results grids, which are paged in the store
+PAGE_SIZES = [50, 100, 500, 1000]
+
+@st.cache_resource
+def get_result_caches():
+    # Shared by all sessions; line counts are keyed by repository and remote HEAD, and those that do
+    # not fit in memory spill to RESULT_CACHE_PATH
+    return {
+        "search": ResultCache("search", max_entries=256, ttl_seconds=SEARCH_CACHE_SECONDS),
+        "basic_analysis": ResultCache("basic_analysis", max_entries=256, ttl_seconds=SEARCH_CACHE_SECONDS),
+        "line_counts": ResultCache("line_counts", ttl_seconds=LINE_COUNT_CACHE_SECONDS, spill_path=RESULT_CACHE_PATH),
+        "file_breakdowns": ResultCache("file_breakdowns", max_entries=32, max_bytes=FILE_BREAKDOWN_CACHE_BYTES,
+                                       ttl_seconds=LINE_COUNT_CACHE_SECONDS),
+    }
+
+@st.cache_resource
+def get_server_metrics():
+    # Search latency and advanced analysis queue timings for the lifetime of the server process
+    return RunMetrics()
+
+@st.cache_resource
+def get_github_client():
+    # One pooled client per server process; GITHUB_TOKEN (environment or .env) raises the rate limit
+    return repo_analysis.create_github_client(get_server_metrics())
+
+@st.cache_resource
+def get_page_prefetcher():
+    # Shared by all sessions, so a page one user prefetched is instant for the next
+    return PagePrefetcher(get_github_client(), get_result_caches()["search"])
 
-@st.cache_data
 def search_github_repositories(query, page, per_page=50):
-    url = 'https://api.github.com/search/repositories'
-    params = {'q': query, 'page': page, 'per_page': per_page}
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        return response.json()['items']
-    else:
-        st.error(f"Failed to retrieve repositories. Status code: {response.status_code}")
+    # Pages are cached and prefetched by the shared PagePrefetcher
+    try:
+        return get_page_prefetcher().get(query, page, per_page)
+    except GitHubSearchError as e:
+        st.error(str(e))
+        return None
+    except requests.RequestException as e:
+        st.error(f"Failed to retrieve repositories: {e}")
         return None
 
-def clone_repo(repo_url, clone_dir):
-    try:
-        if not os.path.exists(clone_dir):
-            os.makedirs(clone_dir)
-        Repo.clone_from(repo_url, clone_dir, multi_options=["--depth 1"])
-    except Exception as e:
-        st.error(f"Error cloning repository {repo_url}: {e}")
-
-def count_lines_of_code(directory):
-    total_lines = 0
-    language_lines = {
-        ".java": 0,
-        ".py": 0,
-        ".js": 0,
-        ".rs": 0,
-        ".css": 0,
-        ".html": 0,
-    }
-    total_lines_without_spaces_or_comments = 0
-    comment_lines = 0
-    empty_lines = 0
-
-    for root, _, files in os.walk(directory):
-        for file in files:
-            file_path = os.path.join(root, file)
-            file_extension = os.path.splitext(file_path)[1]
-            if file_extension in language_lines:
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        for line in f:
-                            total_lines += 1
-                            stripped_line = line.strip()
-                            if not stripped_line:
-                                empty_lines += 1
-                            elif (stripped_line.startswith("//") or stripped_line.startswith("/*") or
-                                  stripped_line.startswith("*") or stripped_line.startswith("#") or
-                                  stripped_line.startswith("<!--") or stripped_line.startswith("-->")):
-                                comment_lines += 1
-                            else:
-                                total_lines_without_spaces_or_comments += 1
-                                language_lines[file_extension] += 1
-                except UnicodeDecodeError:
-                    pass
-                except Exception as e:
-                    st.error(f"Error reading file {file_path}: {e}")
+def report_file_error(file_path, message):
+    st.error(f"Error reading file {file_path}: {message}")
 
-    return {
-        "total_lines": total_lines,
-        "java_lines": language_lines[".java"],
-        "python_lines": language_lines[".py"],
-        "javascript_lines": language_lines[".js"],
-        "rust_lines": language_lines[".rs"],
-        "css_lines": language_lines[".css"],
-        "html_lines": language_lines[".html"],
-        "total_lines_without_spaces_or_comments": total_lines_without_spaces_or_comments,
-        "comment_lines": comment_lines,
-        "empty_lines": empty_lines
-    }
+# Detailed Analysis modes, as shown in the UI
+ANALYSIS_MODES = {
+    "Working tree": repo_analysis.WORKING_TREE_MODE,
+    "Sparse checkout (source files only)": repo_analysis.SPARSE_CHECKOUT_MODE,
+    "Object storage (no checkout)": repo_analysis.OBJECT_STORE_MODE,
+}
 
-@st.cache_data
 def perform_basic_analysis(repositories):
-    basic_analysis_results = []
-    for repo in repositories:
-        basic_analysis_result = {
-            "Favorite": "",
-            "Name": repo['name'],
-            "Description": repo['description'],
-            "Stars": repo['stargazers_count'],
-            "Forks": repo['forks_count'],
-            "Language": repo['language'],
-            "Size (KB)": repo['size'],
-            "URL": repo['html_url'],  # Include repository URL
-            "Created At": repo['created_at'],
-            "Updated At": repo['updated_at'],
-            "Default Branch": repo['default_branch'],
-            "Open Issues": repo['open_issues'],
-            "Watchers": repo['watchers'],
-            "License": repo['license']['name'] if repo['license'] else None,
-        }
-        basic_analysis_results.append(basic_analysis_result)
-
-    return basic_analysis_results
+    # Keyed by URL and last update, so a repository changed on GitHub gets a fresh row
+    key = tuple((repo['html_url'], repo['updated_at']) for repo in repositories)
+    rows = get_result_caches()["basic_analysis"].get_or_compute(
+        key, lambda: [{"Favorite": "", **repo_analysis.basic_analysis_result(repo)} for repo in repositories]
+    )
+    # Copies, the cached rows are shared with other sessions
+    return [dict(row) for row in rows]
 
 def save_to_existing_csv(df, csv_filename):
     df.to_csv(csv_filename, index=False)
@@ -110,53 +103,178 @@ def restructure_favorites_df(favorites):
     return df
 
 def read_csv_with_error_handling(filename):
-    valid_lines = []
-    with open(filename, 'r') as file:
-        for i, line in enumerate(file):
-            try:
-                pd.read_csv(StringIO(line))
-                valid_lines.append(line)
-            except pd.errors.ParserError:
-                st.warning(f"Skipping malformed line {i + 1}: {line.strip()}")
-            except Exception as e:
-                st.error(f"Error reading line {i + 1} from CSV file: {e}")
-
-    if valid_lines:
-        return pd.read_csv(StringIO(''.join(valid_lines)))
-    else:
-        return pd.DataFrame()  # Return empty DataFrame if no valid lines
-
-def perform_detailed_analysis(repositories):
-    detailed_analysis_results = []
-
-    for index, repo in repositories.iterrows():
-        repo_name = repo['Name']
-        repo_url = repo['URL']
-        clone_dir = f"./temp_cloned_repos/{repo_name}"
-
-        clone_repo(repo_url, clone_dir)
-        if os.path.exists(clone_dir):
-            line_counts = count_lines_of_code(clone_dir)
-            detailed_analysis_result = {
-                "Name": repo_name,
-                "Total lines": line_counts['total_lines'],
-                "Total lines without spaces or comments": line_counts['total_lines_without_spaces_or_comments'],
-                "Java lines": line_counts['java_lines'],
-                "Python lines": line_counts['python_lines'],
-                "JavaScript lines": line_counts['javascript_lines'],
-                "Rust lines": line_counts['rust_lines'],
-                "CSS lines": line_counts['css_lines'],
-                "HTML lines": line_counts['html_lines'],
-                "Comment lines": line_counts['comment_lines'],
-                "Empty lines": line_counts['empty_lines']
-            }
-            detailed_analysis_results.append(detailed_analysis_result)
-
-            shutil.rmtree(clone_dir)
-        else:
-            st.warning(f"Failed to clone repository {repo_name}.")
+    df, bad_lines = csv_loader.load_csv(filename)
+    if bad_lines:
+        # Report malformed lines in bulk rather than one warning per line
+        details = "\n".join(f"- line {line_number}: {reason}" for line_number, reason in bad_lines[:MAX_REPORTED_BAD_LINES])
+        more = len(bad_lines) - MAX_REPORTED_BAD_LINES
+        if more > 0:
+            details += f"\n- ... and {more} more"
+        st.warning(f"Skipped {len(bad_lines)} malformed lines in {filename}:\n{details}")
+    return df
+
+@st.cache_resource
+def get_analysis_cache():
+    return AnalysisCache()
+
+def analyze_repositories_concurrently(repositories, max_workers=DEFAULT_ANALYSIS_WORKERS, cache=None, analysis_mode=repo_analysis.WORKING_TREE_MODE, metrics=None):
+    # repo_analysis.analyze_repositories_concurrently with the worker threads attached to this session
+    ctx = get_script_run_ctx()
+
+    def attach_script_run_ctx():
+        # Lets st.error/st.warning calls from worker threads reach the current session
+        add_script_run_ctx(threading.current_thread(), ctx)
+
+    return repo_analysis.analyze_repositories_concurrently(
+        repositories, max_workers=max_workers, cache=cache, mode=analysis_mode,
+        on_error=report_file_error, initializer=attach_script_run_ctx, metrics=metrics,
+        shared_cache=get_result_caches()["line_counts"]
+    )
+
+def refresh_favorite_repositories(favorites_df, store, favorites_repos_dir="./favorites_repos"):
+    # Re-analyse favourites that already have a clone under favorites_repos by fetching into it
+    # and recounting only the files changed since the last analysis
+    refreshed_results = []
+    for _, repo in favorites_df.iterrows():
+        repo_dir = os.path.join(favorites_repos_dir, repo['Name'])
+        if not os.path.isdir(repo_dir):
+            continue
+        try:
+            line_counts, commit_sha, recounted_files = refresh_repository(repo_dir, on_error=report_file_error)
+        except Exception as e:
+            st.error(f"Error refreshing repository {repo['Name']}: {e}")
+            continue
+        get_analysis_cache().put(repo['URL'], commit_sha, line_counts)
+        get_result_caches()["line_counts"].put((normalize_repo_url(repo['URL']), commit_sha), line_counts)
+        refreshed_results.append(build_detailed_analysis_result(repo['Name'], line_counts))
+
+    refreshed_df = pd.DataFrame(refreshed_results)
+    if not refreshed_df.empty:
+        with get_server_metrics().timer(PERSIST):
+            store.upsert_advanced(refreshed_df)
+    return refreshed_df
+
+@st.cache_resource
+def get_favorites_store():
+    store = FavoritesStore()
+    if not store.is_imported():
+        # One-time import of the CSV files used before the store existed
+        favorites_df = read_csv_with_error_handling(FAVORITES_CSV) if os.path.exists(FAVORITES_CSV) else pd.DataFrame()
+        advanced_favorites_df = read_csv_with_error_handling(ADVANCED_FAVORITES_CSV) if os.path.exists(ADVANCED_FAVORITES_CSV) else pd.DataFrame()
+        store.import_dataframes(favorites_df, advanced_favorites_df)
+    return store
+
+@st.cache_resource
+def get_analysis_queue():
+    # Workers run in the server process, independent of any browser session
+    queue = AnalysisQueue(get_favorites_store(), get_analysis_cache(), metrics=get_server_metrics())
+    queue.start()
+    return queue
+
+def dequeue_removed_favorites(queue, store):
+    # Jobs of repositories that stopped being favourites before they finished; without an advanced
+    # row yet they would otherwise still save one, and their clone, when they finish
+    removed_names = set(queue.active_names()).difference(store.favorite_names()['Name'])
+    if removed_names:
+        queue.remove(removed_names)
+
+def display_queue_status(jobs_df):
+    finished = int(jobs_df['Status'].isin([DONE, FAILED]).sum())
+    st.write("Advanced analysis queue:")
+    st.progress(finished / len(jobs_df), text=f"{finished} of {len(jobs_df)} repositories finished")
+    st.dataframe(jobs_df, hide_index=True)
+
+@st.experimental_fragment(run_every=QUEUE_POLL_SECONDS)
+def poll_analysis_queue(queue):
+    # Reruns on its own while jobs are active; a full rerun once they are all finished shows the new results
+    display_queue_status(queue.jobs())
+    if not queue.has_active_jobs():
+        st.rerun()
+
+def display_diagnostics(metrics, title):
+    st.write(f"#### {title}")
+    data = metrics.to_dict()
+    st.json(data['summary'])
+    if data['stages']:
+        stages_df = pd.DataFrame.from_dict(data['stages'], orient='index')
+        stages_df.columns = ["Calls", "Seconds", "Max Seconds"]
+        st.dataframe(stages_df)
+    if data['repositories']:
+        repositories_df = pd.DataFrame.from_dict(
+            {repository: {**values['stages'], **values['counters']} for repository, values in data['repositories'].items()},
+            orient='index'
+        )
+        st.dataframe(repositories_df)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("Download JSON", metrics.to_json(), file_name="metrics.json", mime="application/json", key=f"{title}_json")
+    with col2:
+        st.download_button("Download Prometheus", metrics.to_prometheus(), file_name="metrics.prom", mime="text/plain", key=f"{title}_prometheus")
+
+    profile_stats = metrics.profile_stats()
+    if profile_stats:
+        st.text(profile_stats)
+
+def load_file_breakdowns(paths):
+    # One table of the breakdowns at paths by repository name, shared by all sessions. The key holds
+    # every file's modification time, so a file is read again only after it was rewritten.
+    key = tuple((name, path, mtime) for name, (path, mtime) in sorted(paths.items()))
+    return get_result_caches()["file_breakdowns"].get_or_compute(
+        key, lambda: file_breakdown.load_breakdowns({name: path for name, (path, _) in paths.items()})
+    )
+
+def open_breakdown_subdirectory():
+    name = st.session_state.breakdown_subdirectory
+    if name:
+        directory = st.session_state.get("breakdown_directory", "")
+        st.session_state.breakdown_directory = f"{directory}/{name}" if directory else name
+        st.session_state.breakdown_subdirectory = ""
+
+def close_breakdown_directory():
+    st.session_state.breakdown_directory = st.session_state.get("breakdown_directory", "").rpartition("/")[0]
+
+def display_file_breakdown(names, favorites_repos_dir="./favorites_repos"):
+    # Drill-down into the per-file counts saved next to the clones of favourites; nothing is read from the clones
+    paths = {}
+    for name in names:
+        path = file_counts_path(os.path.join(favorites_repos_dir, name))
+        try:
+            paths[name] = (path, os.stat(path).st_mtime_ns)
+        except OSError:
+            continue
+    if not paths:
+        st.info("No file breakdowns saved yet. Run Update or Refresh Advanced Analysis first.")
+        return
+
+    repository = st.selectbox("Repository", ["All favorites"] + sorted(paths), key="breakdown_repository")
+    table = load_file_breakdowns(paths if repository == "All favorites" else {repository: paths[repository]})
+
+    # Browsed one level at a time, so only the subdirectories of the current directory are sent to the browser
+    directory = st.session_state.get("breakdown_directory", "")
+    files = file_breakdown.under_directory(table, directory)
+    if directory and files.num_rows == 0:
+        # Not in the repository chosen now
+        directory = st.session_state.breakdown_directory = ""
+        files = table
+    entries = file_breakdown.directory_entries(table, directory)
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.selectbox("Open subdirectory", [""] + sorted(entries.loc[entries["is_directory"], "name"]),
+                     key="breakdown_subdirectory", format_func=lambda name: name or "(choose)",
+                     on_change=open_breakdown_subdirectory)
+    with col2:
+        st.button("Up", disabled=not directory, on_click=close_breakdown_directory)
+    st.write(f"/{directory}: {files.num_rows} files")
+    st.dataframe(entries, hide_index=True)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.write("Languages")
+        st.dataframe(file_breakdown.language_totals(files), hide_index=True)
+    with col2:
+        st.write("Largest files")
+        st.dataframe(file_breakdown.largest_files(files), hide_index=True)
 
-    return detailed_analysis_results
 
 def delete_selected_repositories(df, selected_repos):
     updated_df = df[~df['name'].isin(selected_repos['name'])]
@@ -165,7 +283,7 @@ def delete_selected_repositories(df, selected_repos):
 def save_df_to_csv(df, filename):
     df.to_csv(filename, index=False)
 
-def display_aggrid_table(df, key):
+def display_aggrid_table(df, key, sortable=True):
     # Ensure 'Favorite' column is at the start
     cols = df.columns.tolist()
     if 'Favorite' in cols:
@@ -174,7 +292,7 @@ def display_aggrid_table(df, key):
     
     gb = GridOptionsBuilder.from_dataframe(df)
     gb.configure_column("Favorite", editable=True) 
-    gb.configure_default_column(sortable=True, resizable=True)  
+    gb.configure_default_column(sortable=sortable, resizable=True)
 
     gridOptions = gb.build()
 
@@ -188,43 +306,91 @@ def display_aggrid_table(df, key):
 
     return grid_return
 
-def sync_favorites_with_selection(df_basic, favorites):
-    favorites_set = set(favorites['URL'])  # Use 'URL' for matching
-    df_basic['Favorite'] = df_basic['URL'].apply(lambda x: x in favorites_set)
-    return df_basic
-
+def display_detailed_analysis_table(detailed_df, key=None, sortable=True):
+    detailed_df = fill_language_columns(detailed_df)
+    # Configure AgGrid with default and optional columns
+    gb_detail = GridOptionsBuilder.from_dataframe(detailed_df)
+    gb_detail.configure_default_column(sortable=sortable, resizable=True)
 
-def update_favorites(df_table, favorites_csv):
-    # Read the existing favorites from the CSV file, handling any errors that may occur
-    favorites_df = read_csv_with_error_handling(favorites_csv)
+    # Configure columns to show/hide based on user selection
+    for column in detailed_df.columns:
+        gb_detail.configure_column(column, hide=False)
 
-    # Extract the current URLs from the df_table and the favorites CSV into sets for easy comparison
-    current_urls = set(df_table['URL'])
-    favorite_urls = set(favorites_df['URL'])
+    grid_options_detail = gb_detail.build()
 
-    # Identify URLs to add: URLs that are marked as favorites in df_table but are not yet in the favorites CSV
-    urls_to_add = set(df_table['URL'][df_table['Favorite']]).difference(favorite_urls)
+    return AgGrid(detailed_df, key=key, gridOptions=grid_options_detail, enable_enterprise_modules=True, allow_unsafe_jscode=True)
 
-    # Identify URLs to potentially remove: URLs that are not marked as favorites in df_table
-    unchecked_urls = set(df_table['URL'][~df_table['Favorite']])
+def display_paged_table(key, query, columns, display):
+    # Filtering, sorting and paging run in the store and only the current page is sent to the browser.
+    # query(offset, limit, sort_column, descending, search) returns (page_df, matching rows);
+    # display(page_df, grid_key) renders the page. Returns what display returned.
+    col1, col2, col3, col4 = st.columns([3, 2, 1, 1])
+    with col1:
+        search = st.text_input("Filter", key=f"{key}_search")
+    with col2:
+        sort_column = st.selectbox("Sort by", ["Saved order"] + list(columns), key=f"{key}_sort")
+    with col3:
+        descending = st.checkbox("Descending", key=f"{key}_descending")
+    with col4:
+        page_size = st.selectbox("Rows per page", PAGE_SIZES, index=1, key=f"{key}_page_size")
+    sort_column = None if sort_column == "Saved order" else sort_column
+
+    page_key = f"{key}_page"
+    page = st.session_state.get(page_key, 1)
+    page_df, total = query((page - 1) * page_size, page_size, sort_column, descending, search)
+    pages = max(1, math.ceil(total / page_size))
+    if page > pages:
+        # The filter or page size changed under the current page
+        page = st.session_state[page_key] = pages
+        page_df, total = query((page - 1) * page_size, page_size, sort_column, descending, search)
+
+    # A new grid per page, so the browser never mixes rows of different pages
+    result = display(page_df, f"{key}_{page}_{page_size}_{sort_column}_{descending}_{search}")
+    st.number_input(f"Page (of {pages}, {total} rows)", min_value=1, max_value=pages, key=page_key)
+    return result
+
+def sync_favorites_with_selection(df_basic, favorite_urls):
+    df_basic['Favorite'] = df_basic['URL'].isin(favorite_urls)  # Use 'URL' for matching
+    return df_basic
 
-    # Determine URLs to remove: URLs that are currently in favorites but are unchecked in df_table
-    urls_to_remove = favorite_urls.intersection(unchecked_urls)
 
-    # Create a DataFrame of the new URLs to add by filtering df_table for URLs in urls_to_add
-    df_table_checked = df_table[df_table['URL'].isin(urls_to_add)]
+def get_favorite_flags(urls, store, state_key):
+    # {URL: Favorite} for the rows on screen. It is read from the store once per page of rows and kept
+    # in session_state until the store is written to, so plain reruns do no store I/O at all.
+    urls = list(urls)
+    cached = st.session_state.get(state_key)
+    if cached is None or cached['revision'] != store.revision or list(cached['flags']) != urls:
+        revision = store.revision
+        favorite_urls = store.favorite_urls(urls)
+        cached = {'revision': revision, 'flags': {url: url in favorite_urls for url in urls}}
+        st.session_state[state_key] = cached
+    return cached['flags']
+
+
+def apply_favorite_changes(grid_data, reference_df, store, state_key):
+    # Writes only the rows whose Favorite checkbox differs from what was last rendered
+    cached = st.session_state.get(state_key)
+    if cached is None or grid_data is None or grid_data.empty:
+        return
+    flags = cached['flags']
+    changed = {
+        url: bool(favorite) for url, favorite in zip(grid_data['URL'], grid_data['Favorite'])
+        if url in flags and flags[url] != bool(favorite)
+    }
+    if not changed:
+        return
 
-    # Update the favorites DataFrame to remove the URLs that should no longer be favorites   ~
-    favorites_df = favorites_df[~favorites_df['URL'].isin(urls_to_remove)]
+    changed_rows = reorder_columns(grid_data[grid_data['URL'].isin(changed)].copy(), reference_df)
+    urls_to_add = [url for url, favorite in changed.items() if favorite]
+    urls_to_remove = [url for url, favorite in changed.items() if not favorite]
+    if urls_to_add:
+        store.upsert_favorites(changed_rows[changed_rows['URL'].isin(urls_to_add)].drop(columns=['Favorite']))
+    if urls_to_remove:
+        store.delete_favorites(urls_to_remove)
 
-    # Drop the 'Favorite' column from df_table_checked as it is not needed in the favorites CSV
-    df_table_checked = df_table_checked.drop(columns=['Favorite'])
-    
-    # Concatenate the updated favorites DataFrame with the new entries to add
-    updated_favorites_df = pd.concat([favorites_df, df_table_checked])
-    
-    # Save the updated favorites DataFrame back to the CSV file
-    save_to_existing_csv(updated_favorites_df, favorites_csv)
+    # The grid already shows these values, so the cached view stays valid after our own write
+    flags.update(changed)
+    cached['revision'] = store.revision
 
 
 def reorder_columns(grid_data, reference_df):
@@ -272,17 +438,28 @@ if 'query' not in st.session_state:
 
 menu_options = ["GitHub Repository Search and Code Analysis", "Favorites"]
 choice = st.sidebar.selectbox("Select Option", menu_options)
+show_diagnostics = st.sidebar.checkbox("Show diagnostics")
+if st.session_state.pop("profile_run_done", False):
+    # A widget's state can only be changed before it is drawn, so the run that was profiled leaves this for the next rerun
+    st.session_state.profile_next_run = False
+profile_next_run = st.sidebar.checkbox(
+    "Profile next Detailed Analysis run", key="profile_next_run",
+    help="Profiles one run and is then cleared. A profiled run analyzes one repository at a time, ignoring Concurrent clones."
+)
 
 if choice == "GitHub Repository Search and Code Analysis":
     st.title("GitHub Repository Search and Code Analysis")
 
-    col1, col2 = st.columns([3, 1])
+    col1, col2, col3 = st.columns([3, 1, 1])
     with col1:
         query = st.text_input("Enter search query:", value=st.session_state.query)
         
     with col2:
         per_page = st.number_input("Results per page (max 100)", min_value=1, max_value=100, value=100)
 
+    with col3:
+        max_workers = st.number_input(f"Concurrent clones (max {MAX_ANALYSIS_WORKERS})", min_value=1, max_value=MAX_ANALYSIS_WORKERS, value=DEFAULT_ANALYSIS_WORKERS)
+
     if st.button("Search"):
         st.session_state.query = query
         st.session_state.current_page = 1  # Reset to first page on new search
@@ -294,23 +471,22 @@ if choice == "GitHub Repository Search and Code Analysis":
         basic_analysis_results = perform_basic_analysis(st.session_state.repositories)
         st.session_state.basic_analysis_results = basic_analysis_results
 
-        # Read favorites CSV and update the favorite column
-        csv_filename = "favorites.csv"
+        # Read favorites and update the favorite column
+        favorites_store = get_favorites_store()
         try:
-            favorites_df = read_csv_with_error_handling(csv_filename)
-            df_basic_analysis = sync_favorites_with_selection(pd.DataFrame(st.session_state.basic_analysis_results), favorites_df)
+            df_basic_analysis = pd.DataFrame(st.session_state.basic_analysis_results)
+            favorite_flags = get_favorite_flags(df_basic_analysis['URL'], favorites_store, 'basic_analysis_favorites')
+            df_basic_analysis = sync_favorites_with_selection(df_basic_analysis, [url for url, favorite in favorite_flags.items() if favorite])
             
         except Exception as e:
-            st.error(f"Error reading favorites CSV file: {e}")
+            st.error(f"Error reading favorites: {e}")
             df_basic_analysis = pd.DataFrame(st.session_state.basic_analysis_results)
 
         # Display basic analysis table and capture selected rows
         grid_return = display_aggrid_table(df_basic_analysis, 'basic_analysis')
 
-        
-        columns_order = df_basic_analysis.columns
-        df_reordered = reorder_columns(grid_return.data, df_basic_analysis)
-        update_favorites(df_reordered, csv_filename)
+        # Sync only the checkboxes that changed since the last render
+        apply_favorite_changes(grid_return.data, df_basic_analysis, favorites_store, 'basic_analysis_favorites')
         
 
 
@@ -333,6 +509,10 @@ if choice == "GitHub Repository Search and Code Analysis":
         with col3:
             st.write(f"Page {st.session_state.current_page}")
 
+        # Load the neighbouring pages while this one is on screen
+        get_page_prefetcher().prefetch(st.session_state.query, st.session_state.current_page, per_page)
+
+        analysis_mode = st.radio("Detailed analysis mode", list(ANALYSIS_MODES), horizontal=True)
         if st.button("Detailed Analysis"):
             st.session_state.detailed_analysis_trigger = True
 
@@ -340,161 +520,76 @@ if choice == "GitHub Repository Search and Code Analysis":
         st.write("### Code Analysis - Detailed Information")
 
         progress_bar = st.progress(0)
+        table_placeholder = st.empty()
         total_repos = len(st.session_state.repositories)
         detailed_analysis_results = []
 
-        for index, repo in enumerate(st.session_state.repositories):
-            repo_name = repo['name']
-            repo_url = repo['clone_url']
-            clone_dir = f"./temp_cloned_repos/{repo_name}"
-
-            clone_repo(repo_url, clone_dir)
-            line_counts = count_lines_of_code(clone_dir)
-            detailed_analysis_result = {
-                "Index": index + 1,  # Adding row index
-                "Name": repo_name,
-                "Total lines": line_counts['total_lines'],
-                "Total lines without spaces or comments": line_counts['total_lines_without_spaces_or_comments'],
-                "Java lines": line_counts['java_lines'],
-                "Python lines": line_counts['python_lines'],
-                "JavaScript lines": line_counts['javascript_lines'],
-                "Rust lines": line_counts['rust_lines'],
-                "CSS lines": line_counts['css_lines'],
-                "HTML lines": line_counts['html_lines'],
-                "Comment lines": line_counts['comment_lines'],
-                "Empty lines": line_counts['empty_lines']
-            }
-            detailed_analysis_results.append(detailed_analysis_result)
-
-            progress_bar.progress((index + 1) / total_repos)
-
-            shutil.rmtree(clone_dir)
-
-        # Display detailed analysis results using AgGrid
-        if detailed_analysis_results:
-            detailed_df = pd.DataFrame(detailed_analysis_results)
-
-            # Configure AgGrid with default and optional columns
-            gb_detail = GridOptionsBuilder.from_dataframe(detailed_df)
-            gb_detail.configure_default_column(sortable=True, resizable=True)
-
-            # Configure columns to show/hide based on user selection
-            
-            gb_detail.configure_column("Name", hide=False)
-            gb_detail.configure_column("Total lines", hide=False)
-            gb_detail.configure_column("Total lines without spaces or comments", hide=False)
-            gb_detail.configure_column("Java lines", hide=False)
-            gb_detail.configure_column("Python lines", hide=False)
-            gb_detail.configure_column("JavaScript lines", hide=False)
-            gb_detail.configure_column("Rust lines", hide=False)
-            gb_detail.configure_column("CSS lines", hide=False)
-            gb_detail.configure_column("HTML lines", hide=False)
-            gb_detail.configure_column("Comment lines", hide=False)
-            gb_detail.configure_column("Empty lines", hide=False)
-
-            grid_options_detail = gb_detail.build()
-
-            AgGrid(detailed_df, gridOptions=grid_options_detail, enable_enterprise_modules=True, allow_unsafe_jscode=True)
+        # Stage timings of this run; cProfile only runs when asked for, it slows the run down noticeably
+        run_metrics = RunMetrics(profile=profile_next_run)
+        if profile_next_run:
+            st.info("Profiling this run: repositories are analyzed one at a time.")
+        completed = 0
+        for index, detailed_analysis_result, error in analyze_repositories_concurrently(st.session_state.repositories, max_workers=max_workers, cache=get_analysis_cache(), analysis_mode=ANALYSIS_MODES[analysis_mode], metrics=run_metrics):
+            completed += 1
+            progress_bar.progress(completed / total_repos)
+
+            if error is not None:
+                st.warning(f"Failed to analyze repository {st.session_state.repositories[index]['name']}: {error}")
+                continue
+
+            detailed_analysis_results.append({"Index": index + 1, **detailed_analysis_result})  # Adding row index
+
+            # Stream results into the table as they complete, keeping search order
+            detailed_df = pd.DataFrame(detailed_analysis_results).sort_values("Index")
+            with table_placeholder.container():
+                display_detailed_analysis_table(detailed_df, key=f"detailed_analysis_{completed}")
 
+        run_metrics.finish()
+        st.session_state.last_run_metrics = run_metrics
         st.session_state.detailed_analysis_trigger = False
+        if profile_next_run:
+            st.session_state.profile_run_done = True
 elif choice == "Favorites":
     st.title("Favorites")
-    csv_filename = "favorites.csv"
-    advanced_csv_filename = "advanced_favorites.csv"
+    favorites_store = get_favorites_store()
 
     try:
-        
-        favorites_df = read_csv_with_error_handling(csv_filename)
-        
-        if not favorites_df.empty:
-
-            csv_filename = "favorites.csv"
-            try:
-                favorites_df = read_csv_with_error_handling(csv_filename)
-                df_basic_analysis = sync_favorites_with_selection(favorites_df, favorites_df)
-            except Exception as e:
-                st.error(f"Error reading favorites CSV file: {e}")
-                
+        if favorites_store.count_favorites() > 0:
             st.write("Displaying favorites table...")
-            grid_return = display_aggrid_table(df_basic_analysis, 'favourites_basic_analysis')
+
+            def display_favorites_page(page_df, grid_key):
+                # Every row of the favourites table is a favourite
+                page_df = sync_favorites_with_selection(page_df, set(page_df['URL']))
+                return page_df, display_aggrid_table(page_df, grid_key, sortable=False)
+
+            df_basic_analysis, grid_return = display_paged_table(
+                'favourites_basic_analysis', favorites_store.query_favorites, FAVORITES_COLUMNS, display_favorites_page
+            )
 
             if st.button("Update"):
-                columns_order = df_basic_analysis.columns
+                # Only the rows of the page on screen can have changed
                 df_reordered = reorder_columns(grid_return.data, df_basic_analysis)
-                update_favorites(df_reordered, csv_filename)
+                update_favorites(df_reordered, favorites_store)
+                dequeue_removed_favorites(get_analysis_queue(), favorites_store)
                 st.success("Updated successfully")
                 st.rerun()
                 
             if st.button("Update Advanced Analysis"):
-                try:
-                    advanced_favorites_df = read_csv_with_error_handling(advanced_csv_filename)
-                except Exception as e:
-                    st.error(f"Error reading advanced favorites CSV file: {e}")
-                    advanced_favorites_df = pd.DataFrame()
-
-                new_favorites_df = favorites_df[~favorites_df['Name'].isin(advanced_favorites_df['Name'])]
-
-                
+                dequeue_removed_favorites(get_analysis_queue(), favorites_store)
+                new_favorites_df = favorites_store.favorites_without_advanced()
 
                 if not new_favorites_df.empty:
-                    clone_base_dir = "./temp_cloned_repos"
-                    os.makedirs(clone_base_dir, exist_ok=True)
-
-                    new_detailed_analysis_results = []
-                    cloned_repos_dirs = []
-
-                    for index, repo in new_favorites_df.iterrows():
-                        repo_name = repo['Name']
-                        repo_url = repo['URL']
-                        clone_dir = os.path.join(clone_base_dir, repo_name)
-
-                        clone_repo(repo_url, clone_dir)
-                        cloned_repos_dirs.append(clone_dir)
-
-                        line_counts = count_lines_of_code(clone_dir)
-                        detailed_analysis_result = {
-                            "Name": repo_name,
-                            "Total lines": line_counts['total_lines'],
-                            "Total lines without spaces or comments": line_counts['total_lines_without_spaces_or_comments'],
-                            "Java lines": line_counts['java_lines'],
-                            "Python lines": line_counts['python_lines'],
-                            "JavaScript lines": line_counts['javascript_lines'],
-                            "Rust lines": line_counts['rust_lines'],
-                            "CSS lines": line_counts['css_lines'],
-                            "HTML lines": line_counts['html_lines'],
-                            "Comment lines": line_counts['comment_lines'],
-                            "Empty lines": line_counts['empty_lines']
-                        }
-                        new_detailed_analysis_results.append(detailed_analysis_result)
-
-                    new_detailed_analysis_df = pd.DataFrame(new_detailed_analysis_results)
-
-                    if not new_detailed_analysis_df.empty:
-                        advanced_favorites_df = pd.concat([advanced_favorites_df, new_detailed_analysis_df])
-                        save_to_existing_csv(advanced_favorites_df, advanced_csv_filename)
-                        st.success("Newly added repositories analyzed, results saved to advanced favorites and repositories saved to local device.")
-
-                        # Move cloned repositories to new folder
-                        final_clone_dir = "./favorites_repos"
-                        os.makedirs(final_clone_dir, exist_ok=True)
-
-                        for clone_dir in cloned_repos_dirs:
-                            repo_name = os.path.basename(clone_dir)
-                            final_repo_dir = os.path.join(final_clone_dir, repo_name)
-                            if os.path.exists(final_repo_dir):
-                                shutil.rmtree(final_repo_dir)
-                            shutil.move(clone_dir, final_repo_dir)
-
-                    else:
-                        st.warning("No new repositories to analyze.")
+                    # Cloned and counted by the queue workers; each result is saved to advanced favorites as it finishes
+                    get_analysis_queue().enqueue(new_favorites_df)
+                    st.success(f"Queued {len(new_favorites_df)} repositories for analysis. Results are saved to advanced favorites and repositories to the local device as each one finishes.")
                 else:
                     st.warning("No new repositories found in favorites.")
 
-                removed_repos_df = advanced_favorites_df[~advanced_favorites_df['Name'].isin(favorites_df['Name'])]
-                if not removed_repos_df.empty:
-                    removed_repos_names = removed_repos_df['Name'].tolist()
-                    advanced_favorites_df = advanced_favorites_df[advanced_favorites_df['Name'].isin(favorites_df['Name'])]
-                    save_to_existing_csv(advanced_favorites_df, advanced_csv_filename)
+                removed_repos_names = favorites_store.advanced_without_favorites()
+                if removed_repos_names:
+                    # Dequeued first: a job saving its result finishes before its row and clone are deleted
+                    get_analysis_queue().remove(removed_repos_names)
+                    favorites_store.delete_advanced(removed_repos_names)
 
                     # Remove repositories from the final_cloned_repos directory
                     final_clone_dir = "./favorites_repos"
@@ -502,45 +597,62 @@ elif choice == "Favorites":
                         repo_dir = os.path.join(final_clone_dir, repo_name)
                         if os.path.exists(repo_dir):
                             shutil.rmtree(repo_dir)
+                        remove_file_counts(repo_dir)
 
-                            
-                # Display advanced favorites after update
+            # Advanced favorites are shown a page at a time, so they stay on screen while paging through them
+            try:
+                if favorites_store.count_advanced() > 0:
+                    st.write("Advanced Favorites Analysis Results:")
+                    display_paged_table(
+                        'advanced_favorites', favorites_store.query_advanced, favorites_store.advanced_columns(),
+                        lambda page_df, grid_key: display_detailed_analysis_table(page_df, key=grid_key, sortable=False)
+                    )
+                else:
+                    st.warning("No data found in advanced favorites.")
+            except Exception as e:
+                st.error(f"Error reading advanced favorites: {e}")
+
+            analysis_queue = get_analysis_queue()
+            if analysis_queue.has_active_jobs():
+                poll_analysis_queue(analysis_queue)
+            else:
+                jobs_df = analysis_queue.jobs()
+                if not jobs_df.empty:
+                    display_queue_status(jobs_df)
+                    if st.button("Clear finished jobs"):
+                        analysis_queue.clear_finished()
+                        st.rerun()
+
+            if st.button("Refresh Advanced Analysis"):
+                refreshed_df = refresh_favorite_repositories(favorites_store.favorite_names(), favorites_store)
+                if not refreshed_df.empty:
+                    st.success(f"Refreshed {len(refreshed_df)} repositories from their saved clones.")
+                    display_detailed_analysis_table(refreshed_df)
+                else:
+                    st.warning("No saved clones found in favorites_repos. Run Update Advanced Analysis first.")
+
+            if st.checkbox("Show file breakdown"):
                 try:
-                    advanced_favorites_df = read_csv_with_error_handling(advanced_csv_filename)
-
-                    if not advanced_favorites_df.empty:
-                        st.write("Advanced Favorites Analysis Results:")
-                        detailed_df = pd.DataFrame(advanced_favorites_df)
-
-                        # Configure AgGrid with default and optional columns
-                        gb_detail = GridOptionsBuilder.from_dataframe(detailed_df)
-                        gb_detail.configure_default_column(sortable=True, resizable=True)
-
-                        # Configure columns to show/hide based on user selection
-                        gb_detail.configure_column("Name", hide=False)
-                        gb_detail.configure_column("Total lines", hide=False)
-                        gb_detail.configure_column("Total lines without spaces or comments", hide=False)
-                        gb_detail.configure_column("Java lines", hide=False)
-                        gb_detail.configure_column("Python lines", hide=False)
-                        gb_detail.configure_column("JavaScript lines", hide=False)
-                        gb_detail.configure_column("Rust lines", hide=False)
-                        gb_detail.configure_column("CSS lines", hide=False)
-                        gb_detail.configure_column("HTML lines", hide=False)
-                        gb_detail.configure_column("Comment lines", hide=False)
-                        gb_detail.configure_column("Empty lines", hide=False)
-                        grid_options_detail = gb_detail.build()
-                        AgGrid(detailed_df, gridOptions=grid_options_detail, enable_enterprise_modules=True, allow_unsafe_jscode=True)
-                    else:
-                        st.warning("No data found in advanced favorites.")
+                    display_file_breakdown(favorites_store.favorite_names()["Name"])
                 except Exception as e:
-                    st.error(f"Error reading advanced favorites CSV file: {e}")
+                    st.error(f"Error reading file breakdowns: {e}")
+
+            if st.checkbox("Export as CSV"):
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.download_button("Download favorites", favorites_store.favorites_to_csv(), file_name=FAVORITES_CSV, mime="text/csv")
+                with col2:
+                    st.download_button("Download advanced favorites", favorites_store.advanced_to_csv(), file_name=ADVANCED_FAVORITES_CSV, mime="text/csv")
 
         else:
             st.warning("No favorites found.")
     except Exception as e:
-        st.error(f"Error reading favorites CSV file: {e}")
-
-
-
-
-
+        st.error(f"Error reading favorites: {e}")
+
+if show_diagnostics:
+    with st.expander("Diagnostics", expanded=True):
+        if 'last_run_metrics' in st.session_state:
+            display_diagnostics(st.session_state.last_run_metrics, "Last Detailed Analysis")
+        display_diagnostics(get_server_metrics(), "Search and analysis queue")
+        st.write("#### Result caches")
+        st.dataframe(pd.DataFrame([cache.stats() for cache in get_result_caches().values()]), hide_index=True)
@@ -0,0 +1,62 @@
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import csv_loader  # noqa: E402
+from favorites_store import FAVORITES_COLUMNS  # noqa: E402
+
+# Compares the single-pass loader with the original per-line validation on a synthetic favorites.csv.
+# The per-line loader is timed on the first --legacy-rows rows and extrapolated, it is too slow for 100k.
+
+
+def write_favorites_csv(path, rows, bad_every=1000, seed=0):
+    random.seed(seed)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(FAVORITES_COLUMNS)
+        for i in range(rows):
+            row = [
+                f"repo-{i}", f"Description, number {i}", random.randint(0, 100000), random.randint(0, 5000),
+                random.choice(["Python", "Rust", "Java", ""]), random.randint(1, 10 ** 6),
+                f"https://github.com/owner-{i}/repo-{i}", "2020-01-01T00:00:00Z", "2024-01-01T00:00:00Z",
+                "main", random.randint(0, 500), random.randint(0, 100000), "MIT License",
+            ]
+            if bad_every and i % bad_every == bad_every - 1:
+                row.append("unexpected extra field")
+            writer.writerow(row)
+
+
+def time_call(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--legacy-rows", type=int, default=2_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "favorites.csv")
+        write_favorites_csv(path, args.rows)
+        fast_seconds, (df, bad_lines) = time_call(csv_loader.load_csv, path)
+        print(f"single pass: {args.rows} rows in {fast_seconds:.3f}s ({len(df)} loaded, {len(bad_lines)} malformed)")
+
+        legacy_path = os.path.join(temp_dir, "favorites_legacy.csv")
+        write_favorites_csv(legacy_path, args.legacy_rows)
+        legacy_seconds, _ = time_call(csv_loader.load_csv_line_by_line, legacy_path)
+        estimated_seconds = legacy_seconds * args.rows / args.legacy_rows
+        print(f"per line:    {args.legacy_rows} rows in {legacy_seconds:.3f}s, ~{estimated_seconds:.1f}s estimated for {args.rows}")
+        print(f"speedup:     ~{estimated_seconds / fast_seconds:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import line_counter  # noqa: E402
+
+# Times the per-language counters on synthetic Python, JavaScript, Java and C sources against the
+# original loop, which used one list of comment prefixes for every language and no block comment state,
+# and against the byte counter from before the language registry, which the "bytes" mode replaced.
+LEGACY_COMMENT_PREFIXES = ("//", "/*", "*", "#", "<!--", "-->")
+LEGACY_COMMENT_PREFIXES_BYTES = tuple(prefix.encode() for prefix in LEGACY_COMMENT_PREFIXES)
+
+C_LIKE_LINES = [
+    "    int value = compute(left, right);",
+    "    if (value > limit) { return \"see https://example.com/limits\"; }",
+    "    // explain the next step",
+    "",
+    "    result.append(String.format(\"%d items\", count)); // trailing comment",
+]
+SOURCES = {
+    ".py": [
+        "    value = compute(left, right)",
+        "    if value > limit: return 'over # not a comment'",
+        "    # explain the next step",
+        "",
+        "    result.append(f\"{count} items\")  # trailing comment",
+    ],
+    ".js": C_LIKE_LINES + ["    const label = `template ${value}`;"],
+    ".java": C_LIKE_LINES,
+    ".c": C_LIKE_LINES,
+}
+# Multi-line constructs, one of which replaces a plain line 5% of the time
+BLOCKS = {
+    ".py": [['    """', "    Docstring line with a # inside.", '    """'], ["    query = '''SELECT 1'''"]],
+    ".js": [["    /**", "     * JSDoc line", "     */"], ["    call(value /* inline */, other);"]],
+    ".java": [["    /**", "     * Javadoc line", "     */"], ["    call(value /* inline */, other);"]],
+    ".c": [["    /*", "     * Block comment line", "     */"], ["    call(value /* inline */, other);"]],
+}
+
+
+def legacy_count_file(file_path):
+    total_lines = 0
+    code_lines = 0
+    comment_lines = 0
+    empty_lines = 0
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            total_lines += 1
+            stripped_line = line.strip()
+            if not stripped_line:
+                empty_lines += 1
+            elif stripped_line.startswith(LEGACY_COMMENT_PREFIXES):
+                comment_lines += 1
+            else:
+                code_lines += 1
+    return total_lines, code_lines, comment_lines, empty_lines
+
+
+def _legacy_classify_lines_loop(block):
+    lines = block.split(b'\n')
+    if not lines[-1]:
+        lines.pop()
+    code_lines = 0
+    comment_lines = 0
+    empty_lines = 0
+    check_unicode_edges = not block.isascii()
+    for line in lines:
+        stripped_line = line.strip(line_counter._WHITESPACE_CHARS)
+        if check_unicode_edges and stripped_line and (stripped_line[0] >= 0x80 or stripped_line[-1] >= 0x80):
+            stripped_line = line.decode('utf-8').strip()
+            is_comment = stripped_line.startswith(LEGACY_COMMENT_PREFIXES)
+        else:
+            is_comment = stripped_line.startswith(LEGACY_COMMENT_PREFIXES_BYTES)
+        if not stripped_line:
+            empty_lines += 1
+        elif is_comment:
+            comment_lines += 1
+        else:
+            code_lines += 1
+    return len(lines), code_lines, comment_lines, empty_lines
+
+
+def _legacy_classify_lines(block):
+    # The byte counter's classifier before the language registry: the prefix rule with numpy, no tokenizing
+    block = block.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+    if len(block) < line_counter.SMALL_BLOCK_SIZE:
+        return _legacy_classify_lines_loop(block)
+    if not block.endswith(b'\n'):
+        block += b'\n'
+    buf = np.frombuffer(block, dtype=np.uint8)
+    line_ends = np.flatnonzero(buf == 10)
+    line_starts = np.concatenate(([0], line_ends[:-1] + 1))
+    whitespace = np.zeros(256, dtype=bool)
+    whitespace[list(line_counter._WHITESPACE_CHARS)] = True
+    non_whitespace = np.append(np.flatnonzero(~whitespace[buf]), len(buf))
+
+    first = non_whitespace[np.searchsorted(non_whitespace, line_starts)]
+    non_empty = first < line_ends
+    first = first[non_empty]
+    total_lines = len(line_ends)
+    empty_lines = total_lines - len(first)
+    comment_lines = 0
+
+    if not block.isascii():
+        last = non_whitespace[np.searchsorted(non_whitespace, line_ends[non_empty]) - 1]
+        unicode_edges = (buf[first] >= 0x80) | (buf[last] >= 0x80)
+        for start, end in zip(line_starts[non_empty][unicode_edges], line_ends[non_empty][unicode_edges]):
+            stripped_line = block[start:end].decode('utf-8').strip()
+            if not stripped_line:
+                empty_lines += 1
+            elif stripped_line.startswith(LEGACY_COMMENT_PREFIXES):
+                comment_lines += 1
+        first = first[~unicode_edges]
+
+    padded = np.concatenate((buf, np.zeros(4, dtype=np.uint8)))
+    is_comment = np.zeros(len(first), dtype=bool)
+    for prefix in LEGACY_COMMENT_PREFIXES_BYTES:
+        matches = padded[first] == prefix[0]
+        for k in range(1, len(prefix)):
+            matches &= padded[first + k] == prefix[k]
+        is_comment |= matches
+    comment_lines += int(np.count_nonzero(is_comment))
+
+    code_lines = total_lines - empty_lines - comment_lines
+    return total_lines, code_lines, comment_lines, empty_lines
+
+
+def legacy_count_file_bytes(file_path, chunk_size=line_counter.READ_CHUNK_SIZE):
+    total_lines = 0
+    code_lines = 0
+    comment_lines = 0
+    empty_lines = 0
+    pending = b''
+    with open(file_path, 'rb') as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            buffer = pending + data
+            end = len(buffer) - 1 if buffer.endswith(b'\r') else len(buffer)
+            cut = max(buffer.rfind(b'\n', 0, end), buffer.rfind(b'\r', 0, end))
+            if cut < 0:
+                pending = buffer
+                continue
+            block = buffer[:cut + 1]
+            pending = buffer[cut + 1:]
+            if not block.isascii():
+                block.decode('utf-8')
+            counts = _legacy_classify_lines(block)
+            total_lines += counts[0]
+            code_lines += counts[1]
+            comment_lines += counts[2]
+            empty_lines += counts[3]
+    if pending:
+        if not pending.isascii():
+            pending.decode('utf-8')
+        counts = _legacy_classify_lines(pending)
+        total_lines += counts[0]
+        code_lines += counts[1]
+        comment_lines += counts[2]
+        empty_lines += counts[3]
+    return total_lines, code_lines, comment_lines, empty_lines
+
+
+def write_source_files(directory, files_per_language, lines_per_file, seed=0):
+    random.seed(seed)
+    paths = []
+    for extension, lines in SOURCES.items():
+        for i in range(files_per_language):
+            path = os.path.join(directory, f"file_{i}{extension}")
+            body = []
+            while len(body) < lines_per_file:
+                if random.random() < 0.05:
+                    body += random.choice(BLOCKS[extension])
+                else:
+                    body.append(random.choice(lines))
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write("\n".join(body) + "\n")
+            paths.append(path)
+    return paths
+
+
+def time_counter(count_file, paths):
+    start = time.perf_counter()
+    for path in paths:
+        count_file(path)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-language line counter throughput")
+    parser.add_argument("--files", type=int, default=50, help="files per language")
+    parser.add_argument("--lines", type=int, default=2000, help="lines per file")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = write_source_files(temp_dir, args.files, args.lines)
+        megabytes = sum(os.path.getsize(path) for path in paths) / 1e6
+        counters = {
+            "legacy loop": legacy_count_file,
+            "legacy bytes": legacy_count_file_bytes,
+            "text": line_counter.count_file,
+            "bytes": line_counter.count_file_bytes,
+        }
+        results = {name: min(time_counter(count_file, paths) for _ in range(args.repeat)) for name, count_file in counters.items()}
+
+        print(f"{len(paths)} files, {megabytes:.1f} MB")
+        for name, seconds in results.items():
+            print(f"{name:12} {seconds:.3f}s  {megabytes / seconds:6.1f} MB/s  {results['legacy loop'] / seconds:.2f}x legacy loop  "
+                  f"{results['legacy bytes'] / seconds:.2f}x legacy bytes")
+
+
+if __name__ == "__main__":
+    main()
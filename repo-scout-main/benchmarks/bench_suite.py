@@ -0,0 +1,254 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy
+import pandas
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import csv_loader  # noqa: E402
+import line_counter  # noqa: E402
+from bench_csv_loader import write_favorites_csv  # noqa: E402
+from bench_line_counter import BLOCKS, SOURCES  # noqa: E402
+from favorites_store import FavoritesStore, update_favorites  # noqa: E402
+
+# Offline benchmarks of the hot paths on synthetic fixtures of several sizes: count_lines_of_code on
+# generated repository trees, csv_loader.load_csv (behind read_csv_with_error_handling) on
+# favourites files and update_favorites against a populated store. Each result records the best of
+# --repeat timed runs and the tracemalloc peak of one extra run, which is kept separate because
+# tracing slows the code down. Files counted in the process pool are not in the peak, which only
+# covers this process. Results can be saved as a baseline and later runs compared to it:
+#   python benchmarks/bench_suite.py --save-baseline baseline.json
+#   python benchmarks/bench_suite.py --baseline baseline.json
+# Fixtures depend only on their size and --seed, and with --fixture-dir they are kept between runs.
+REPO_SIZES = {"1k": 1_000, "50k": 50_000, "500k": 500_000}
+CSV_SIZES = {"100": 100, "100k": 100_000}
+LINES_PER_FILE = 60
+FILES_PER_DIRECTORY = 100
+# Bump when the generators change, so kept fixtures are rebuilt
+FIXTURE_VERSION = 1
+# Share of the favourites whose checkbox is flipped in the update_favorites benchmark
+FAVORITE_CHANGE_RATE = 0.02
+DEFAULT_TOLERANCE = 0.25
+# Timing differences below this are noise, whatever the ratio
+MIN_SIGNIFICANT_SECONDS = 0.05
+
+
+def write_repository_tree(directory, files, seed=0, lines_per_file=LINES_PER_FILE):
+    # A nested tree of source files in the languages of bench_line_counter, with a few other files and a
+    # node_modules directory that find_source_files skips, like a real checkout
+    random.seed(seed)
+    extensions = list(SOURCES)
+    # A pool of file bodies per language, reused so generating 500k files is bounded by the disk
+    bodies = {}
+    for extension in extensions:
+        bodies[extension] = []
+        for _ in range(20):
+            body = []
+            while len(body) < lines_per_file:
+                if random.random() < 0.05:
+                    body += random.choice(BLOCKS[extension])
+                else:
+                    body.append(random.choice(SOURCES[extension]))
+            bodies[extension].append(("\n".join(body) + "\n").encode())
+
+    for i in range(files):
+        subdirectory = os.path.join(directory, f"pkg_{i // (FILES_PER_DIRECTORY * 10)}", f"mod_{i // FILES_PER_DIRECTORY}")
+        if i % FILES_PER_DIRECTORY == 0:
+            os.makedirs(subdirectory, exist_ok=True)
+        extension = extensions[i % len(extensions)]
+        with open(os.path.join(subdirectory, f"file_{i}{extension}"), 'wb') as f:
+            f.write(random.choice(bodies[extension]))
+
+    skipped_directory = os.path.join(directory, "node_modules", "dependency")
+    os.makedirs(skipped_directory, exist_ok=True)
+    for i in range(max(1, files // 100)):
+        with open(os.path.join(skipped_directory, f"index_{i}.js"), 'wb') as f:
+            f.write(bodies[".js"][0])
+        with open(os.path.join(directory, f"notes_{i}.md"), 'w') as f:
+            f.write("# Notes\n\nNot counted.\n")
+
+
+def fixture(fixture_dir, name, write):
+    # Path of the fixture called name, written by write(path) unless an up-to-date copy is kept
+    path = os.path.join(fixture_dir, name)
+    marker = os.path.join(path, ".fixture")
+    if os.path.exists(marker):
+        with open(marker) as f:
+            if f.read() == str(FIXTURE_VERSION):
+                return path
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    write(path)
+    with open(marker, 'w') as f:
+        f.write(str(FIXTURE_VERSION))
+    return path
+
+
+def measure(run, setup=lambda: (), repeat=3):
+    # run(*setup()) timed repeat times and once more under tracemalloc; setup is not measured
+    timings = []
+    for _ in range(repeat):
+        args = setup()
+        start = time.perf_counter()
+        run(*args)
+        timings.append(time.perf_counter() - start)
+
+    args = setup()
+    tracemalloc.start()
+    try:
+        run(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"seconds": min(timings), "median_seconds": statistics.median(timings), "peak_memory_bytes": peak}
+
+
+def bench_count_lines(fixture_dir, size, seed, repeat):
+    files = REPO_SIZES[size]
+    directory = fixture(fixture_dir, f"repo_{size}_seed{seed}", lambda path: write_repository_tree(path, files, seed))
+    # Starts the process pool outside the timings, it lives as long as the server does
+    line_counter.get_process_pool()
+    counts = line_counter.count_lines_of_code(directory)
+    result = measure(lambda: line_counter.count_lines_of_code(directory), repeat=repeat)
+    result["items"] = counts["files_counted"]
+    result["lines"] = counts["total_lines"]
+    result["lines_per_second"] = counts["total_lines"] / result["seconds"]
+    return result
+
+
+def bench_load_csv(fixture_dir, size, seed, repeat):
+    rows = CSV_SIZES[size]
+    directory = fixture(fixture_dir, f"csv_{size}_seed{seed}",
+                        lambda path: write_favorites_csv(os.path.join(path, "favorites.csv"), rows, seed=seed))
+    path = os.path.join(directory, "favorites.csv")
+    result = measure(lambda: csv_loader.load_csv(path), repeat=repeat)
+    result["items"] = rows
+    return result
+
+
+def bench_update_favorites(fixture_dir, size, seed, repeat):
+    # A store holding the favourites file, updated from a table in which FAVORITE_CHANGE_RATE of the
+    # stored rows were unchecked and as many new rows checked
+    rows = CSV_SIZES[size]
+    directory = fixture(fixture_dir, f"csv_{size}_seed{seed}",
+                        lambda path: write_favorites_csv(os.path.join(path, "favorites.csv"), rows, seed=seed))
+    favorites_df, _ = csv_loader.load_csv(os.path.join(directory, "favorites.csv"))
+    changed = max(1, int(len(favorites_df) * FAVORITE_CHANGE_RATE))
+    stored_df = favorites_df.iloc[changed:]
+    table_df = favorites_df.copy()
+    table_df["Favorite"] = True
+    table_df.loc[table_df.index[-changed:], "Favorite"] = False
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        def setup():
+            path = os.path.join(temp_dir, f"favorites_{time.perf_counter_ns()}.db")
+            store = FavoritesStore(path)
+            store.upsert_favorites(stored_df)
+            return table_df, store
+
+        result = measure(update_favorites, setup, repeat=repeat)
+    result["items"] = len(table_df)
+    return result
+
+
+BENCHMARKS = {
+    # name -> (function, default sizes); 500k files takes minutes to generate, so it is opt-in
+    "count_lines_of_code": (bench_count_lines, ("1k", "50k")),
+    "load_csv": (bench_load_csv, tuple(CSV_SIZES)),
+    "update_favorites": (bench_update_favorites, tuple(CSV_SIZES)),
+}
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": numpy.__version__,
+        "pandas": pandas.__version__,
+    }
+
+
+def compare(results, baseline, tolerance):
+    # Lines describing every benchmark that got slower or used more memory than the baseline allows
+    regressions = []
+    for key, result in results.items():
+        previous = baseline["results"].get(key)
+        if previous is None:
+            continue
+        for field in ("seconds", "peak_memory_bytes"):
+            if field == "seconds" and result[field] - previous[field] < MIN_SIGNIFICANT_SECONDS:
+                continue
+            if previous[field] and result[field] > previous[field] * (1 + tolerance):
+                regressions.append(f"{key}: {field} {previous[field]:.4g} -> {result[field]:.4g} "
+                                   f"({result[field] / previous[field]:.2f}x)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite on synthetic fixtures")
+    parser.add_argument("--benchmark", action="append", choices=list(BENCHMARKS),
+                        help="benchmark to run, may be repeated; all by default")
+    parser.add_argument("--repo-sizes", nargs="+", choices=list(REPO_SIZES),
+                        help="repository tree sizes for count_lines_of_code (default 1k 50k)")
+    parser.add_argument("--csv-sizes", nargs="+", choices=list(CSV_SIZES), help="favourites file sizes (default all)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fixture-dir", help="keep generated fixtures here between runs instead of a temporary directory")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--save-baseline", help="write the results as the baseline for later runs")
+    parser.add_argument("--baseline", help="baseline JSON to compare with; exits with status 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed slowdown or memory growth over the baseline, as a fraction")
+    args = parser.parse_args()
+
+    sizes = {"count_lines_of_code": args.repo_sizes, "load_csv": args.csv_sizes, "update_favorites": args.csv_sizes}
+    fixture_dir = args.fixture_dir or tempfile.mkdtemp(prefix="repo_scout_bench_")
+    results = {}
+    try:
+        for name in args.benchmark or BENCHMARKS:
+            bench, default_sizes = BENCHMARKS[name]
+            for size in sizes[name] or default_sizes:
+                key = f"{name}[{size}]"
+                result = bench(fixture_dir, size, args.seed, args.repeat)
+                result["items_per_second"] = result["items"] / result["seconds"]
+                results[key] = result
+                print(f"{key:32} {result['seconds']:9.3f}s  {result['items_per_second']:12.0f} items/s  "
+                      f"peak {result['peak_memory_bytes'] / 1e6:8.1f} MB", flush=True)
+    finally:
+        if not args.fixture_dir:
+            shutil.rmtree(fixture_dir, ignore_errors=True)
+
+    report = {"environment": environment(), "seed": args.seed, "repeat": args.repeat, "results": results}
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["environment"] != report["environment"]:
+            print("warning: the baseline was recorded in a different environment", file=sys.stderr)
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"regression: {line}")
+        if regressions:
+            return 1
+        print(f"no regressions over {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
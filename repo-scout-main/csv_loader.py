@@ -0,0 +1,56 @@
+import re
+import warnings
+from io import StringIO
+
+import pandas as pd
+
+# Parses a CSV file once with pandas' C parser. Rows whose field count differs from the header are
+# skipped by the parser itself and reported together, instead of validating every line separately.
+_SKIPPED_LINE_PATTERN = re.compile(r"Skipping line (\d+): (.*)")
+
+
+def _read_csv(source):
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always", pd.errors.ParserWarning)
+        df = pd.read_csv(source, on_bad_lines="warn")
+
+    bad_lines = []
+    for warning in caught:
+        if issubclass(warning.category, pd.errors.ParserWarning):
+            for line_number, reason in _SKIPPED_LINE_PATTERN.findall(str(warning.message)):
+                bad_lines.append((int(line_number), reason))
+    return df, bad_lines
+
+
+def load_csv(filename):
+    # Returns (DataFrame, [(line_number, reason), ...]) for the malformed lines that were skipped
+    try:
+        return _read_csv(filename)
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame(), []
+    except pd.errors.ParserError:
+        # e.g. an unterminated quote; the tokenizer can't resynchronise, so fall back to checking line by line
+        return load_csv_line_by_line(filename)
+
+
+def load_csv_line_by_line(filename):
+    # The original per-line validation: slow (one parser per line) but isolates any kind of broken line
+    valid_lines = []
+    valid_line_numbers = []
+    bad_lines = []
+    with open(filename, 'r') as file:
+        for i, line in enumerate(file):
+            try:
+                pd.read_csv(StringIO(line))
+                valid_lines.append(line)
+                valid_line_numbers.append(i + 1)
+            except Exception as e:
+                bad_lines.append((i + 1, f"{e}: {line.strip()}"))
+
+    if not valid_lines:
+        return pd.DataFrame(), bad_lines  # Return empty DataFrame if no valid lines
+
+    # Lines can still have the wrong number of fields; map those back to their line in the file
+    df, skipped_lines = _read_csv(StringIO(''.join(valid_lines)))
+    bad_lines += [(valid_line_numbers[line_number - 1], reason) for line_number, reason in skipped_lines]
+    return df, sorted(bad_lines)
@@ -0,0 +1,246 @@
+import json
+
+import pandas as pd
+
+from sqlite_connection import connect
+
+# Favourites and advanced analysis results in SQLite, indexed by URL and Name, so an edit
+# touches only the rows that changed instead of rewriting a CSV file. Rows are stored as
+# JSON so the advanced results can gain columns without a schema change.
+DEFAULT_STORE_PATH = "favorites.db"
+FAVORITES_COLUMNS = [
+    "Name", "Description", "Stars", "Forks", "Language", "Size (KB)", "URL", "Created At",
+    "Updated At", "Default Branch", "Open Issues", "Watchers", "License",
+]
+ADVANCED_FAVORITES_COLUMNS = [
+    "Name", "Total lines", "Total lines without spaces or comments", "Java lines", "Python lines",
+    "JavaScript lines", "Rust lines", "CSS lines", "HTML lines", "Comment lines", "Empty lines",
+]
+# Sorting by these reads rows through an expression index instead of sorting the whole table
+INDEXED_FAVORITES_COLUMNS = ["Stars", "Forks", "Size (KB)", "Updated At"]
+INDEXED_ADVANCED_COLUMNS = ["Total lines", "Total lines without spaces or comments"]
+
+
+def _records(df):
+    # Goes through to_json so numpy scalars, NaN and timestamps become plain JSON values
+    return json.loads(df.to_json(orient="records"))
+
+
+def _field(column):
+    # SQL for a column of the JSON row; column names are not parameters, so quotes are refused
+    if '"' in column or "'" in column:
+        raise ValueError(f"Unsupported column name {column!r}")
+    return f"json_extract(data, '$.\"{column}\"')"
+
+
+def _frame(rows, columns):
+    if not rows:
+        return pd.DataFrame(columns=columns)
+    return pd.DataFrame([json.loads(data) for (data,) in rows])
+
+
+class FavoritesStore:
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        # Bumped on every favourites write so callers can tell whether a cached view is still current
+        self.revision = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS favorites ("
+                " url TEXT PRIMARY KEY,"
+                " name TEXT,"
+                " data TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS favorites_name ON favorites (name)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS advanced_favorites ("
+                " name TEXT PRIMARY KEY,"
+                " data TEXT NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            # Every key of the stored advanced rows, kept up to date on writes so listing them reads no rows
+            conn.execute("CREATE TABLE IF NOT EXISTS advanced_columns (name TEXT PRIMARY KEY)")
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'advanced_columns_listed'").fetchone() is None:
+                self._list_advanced_columns(conn)
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('advanced_columns_listed', '1')")
+            for table, columns in (("favorites", INDEXED_FAVORITES_COLUMNS), ("advanced_favorites", INDEXED_ADVANCED_COLUMNS)):
+                for column in columns:
+                    index_name = f"{table}_{column.lower().replace(' ', '_').replace('(', '').replace(')', '')}"
+                    conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({_field(column)})")
+
+    def _connect(self):
+        return connect(self.path)
+
+    def _list_advanced_columns(self, conn):
+        # Rebuilds advanced_columns from the rows, which reads all of them
+        conn.execute("DELETE FROM advanced_columns")
+        conn.execute(
+            "INSERT INTO advanced_columns (name)"
+            " SELECT DISTINCT key FROM advanced_favorites, json_each(advanced_favorites.data)"
+        )
+
+    def is_imported(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM meta WHERE key = 'csv_imported'").fetchone() is not None
+
+    def import_dataframes(self, favorites_df, advanced_favorites_df):
+        # One-time migration from favorites.csv / advanced_favorites.csv
+        if not favorites_df.empty:
+            self.upsert_favorites(favorites_df)
+        if not advanced_favorites_df.empty:
+            self.upsert_advanced(advanced_favorites_df)
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('csv_imported', '1')")
+
+    def load_favorites(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT data FROM favorites ORDER BY rowid").fetchall()
+        return _frame(rows, FAVORITES_COLUMNS)
+
+    def _query_page(self, table, columns, search_fields, offset, limit, sort_column, descending, search):
+        # search_fields are the SQL expressions a filter text is matched against
+        where = ""
+        params = []
+        if search:
+            # % and _ in the filter text match themselves, not any text
+            pattern = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            where = " WHERE " + " OR ".join(f"{field} LIKE ? ESCAPE '\\'" for field in search_fields)
+            params = [f"%{pattern}%"] * len(search_fields)
+        direction = "DESC" if descending else "ASC"
+        # rowid breaks ties in the same direction, so an index on the sort column still gives the order
+        order = f"{_field(sort_column)} {direction}, rowid {direction}" if sort_column else f"rowid {direction}"
+        with self._connect() as conn:
+            total = conn.execute(f"SELECT COUNT(*) FROM {table}{where}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT data FROM {table}{where} ORDER BY {order} LIMIT ? OFFSET ?", params + [limit, offset]
+            ).fetchall()
+        return _frame(rows, columns), total
+
+    def query_favorites(self, offset=0, limit=100, sort_column=None, descending=False, search=None):
+        # (one page of favourites, number of favourites matching search); without sort_column rows keep their saved order.
+        # search matches the name, URL and description.
+        return self._query_page(
+            "favorites", FAVORITES_COLUMNS, ["name", "url", _field("Description")], offset, limit, sort_column, descending, search
+        )
+
+    def count_favorites(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM favorites").fetchone()[0]
+
+    def favorite_names(self):
+        # Name and URL of every favourite, read from the indexed columns without decoding the rows
+        with self._connect() as conn:
+            rows = conn.execute("SELECT name, url FROM favorites ORDER BY rowid").fetchall()
+        return pd.DataFrame(rows, columns=["Name", "URL"])
+
+    def favorites_without_advanced(self):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT data FROM favorites WHERE name NOT IN (SELECT name FROM advanced_favorites) ORDER BY rowid"
+            ).fetchall()
+        return _frame(rows, FAVORITES_COLUMNS)
+
+    def advanced_without_favorites(self):
+        # Names of advanced results whose repository is no longer a favourite
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT name FROM advanced_favorites WHERE name NOT IN (SELECT name FROM favorites WHERE name IS NOT NULL)"
+            ).fetchall()
+        return [name for (name,) in rows]
+
+    def favorite_urls(self, urls=None):
+        # All favourite URLs, or only those among urls
+        with self._connect() as conn:
+            if urls is None:
+                rows = conn.execute("SELECT url FROM favorites").fetchall()
+            else:
+                urls = list(urls)
+                rows = []
+                # Stay below SQLite's bound-parameter limit
+                for i in range(0, len(urls), 500):
+                    batch = urls[i:i + 500]
+                    rows += conn.execute(
+                        f"SELECT url FROM favorites WHERE url IN ({','.join('?' * len(batch))})", batch
+                    ).fetchall()
+        return {url for (url,) in rows}
+
+    def upsert_favorites(self, df):
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO favorites (url, name, data) VALUES (?, ?, ?)"
+                " ON CONFLICT (url) DO UPDATE SET name = excluded.name, data = excluded.data",
+                [(record["URL"], record.get("Name"), json.dumps(record)) for record in _records(df)]
+            )
+        self.revision += 1
+
+    def delete_favorites(self, urls):
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM favorites WHERE url = ?", [(url,) for url in urls])
+        self.revision += 1
+
+    def load_advanced(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT data FROM advanced_favorites ORDER BY rowid").fetchall()
+        return _frame(rows, ADVANCED_FAVORITES_COLUMNS)
+
+    def query_advanced(self, offset=0, limit=100, sort_column=None, descending=False, search=None):
+        return self._query_page(
+            "advanced_favorites", ADVANCED_FAVORITES_COLUMNS, ["name"], offset, limit, sort_column, descending, search
+        )
+
+    def advanced_columns(self):
+        # ADVANCED_FAVORITES_COLUMNS, then the other columns stored rows have, e.g. "<language> lines"
+        with self._connect() as conn:
+            rows = conn.execute("SELECT name FROM advanced_columns").fetchall()
+        extra = {key for (key,) in rows if '"' not in key and "'" not in key} - set(ADVANCED_FAVORITES_COLUMNS)
+        return ADVANCED_FAVORITES_COLUMNS + sorted(extra)
+
+    def count_advanced(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM advanced_favorites").fetchone()[0]
+
+    def upsert_advanced(self, df):
+        records = _records(df)
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO advanced_favorites (name, data) VALUES (?, ?)"
+                " ON CONFLICT (name) DO UPDATE SET data = excluded.data",
+                [(record["Name"], json.dumps(record)) for record in records]
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO advanced_columns (name) VALUES (?)",
+                [(column,) for column in {column for record in records for column in record}]
+            )
+
+    def delete_advanced(self, names):
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM advanced_favorites WHERE name = ?", [(name,) for name in names])
+            # Drops the columns only the deleted rows had; deletes are rare, unlike page views
+            self._list_advanced_columns(conn)
+
+    def favorites_to_csv(self):
+        return self.load_favorites().to_csv(index=False)
+
+    def advanced_to_csv(self):
+        return self.load_advanced().to_csv(index=False)
+
+
+def update_favorites(df_table, store):
+    # Look up only the URLs shown in df_table; the store is indexed by URL
+    favorite_urls = store.favorite_urls(df_table['URL'])
+
+    # Identify URLs to add: URLs that are marked as favorites in df_table but are not yet in the store
+    urls_to_add = set(df_table['URL'][df_table['Favorite']]).difference(favorite_urls)
+
+    # Identify URLs to potentially remove: URLs that are not marked as favorites in df_table
+    unchecked_urls = set(df_table['URL'][~df_table['Favorite']])
+
+    # Determine URLs to remove: URLs that are currently in favorites but are unchecked in df_table
+    urls_to_remove = favorite_urls.intersection(unchecked_urls)
+
+    # Upsert the new rows and delete the removed ones; every other row is left untouched
+    if urls_to_add:
+        # Drop the 'Favorite' column as it is not needed in the favorites store
+        store.upsert_favorites(df_table[df_table['URL'].isin(urls_to_add)].drop(columns=['Favorite']))
+    if urls_to_remove:
+        store.delete_favorites(urls_to_remove)
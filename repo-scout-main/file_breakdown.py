@@ -0,0 +1,117 @@
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from languages import PLAIN_TEXT, language_for_path
+
+# Per-file line counts of a repository as one Arrow table (path, language, the four line counts and the
+# file size), saved as Parquet with the commit it was counted at. The tables of many repositories are
+# concatenated under their repository names, and directories, languages and the largest files are then
+# aggregated with Arrow compute kernels, without reading any clone again.
+LINE_COLUMNS = ["total_lines", "code_lines", "comment_lines", "empty_lines"]
+BREAKDOWN_SCHEMA = pa.schema(
+    [("path", pa.string()), ("language", pa.dictionary(pa.int16(), pa.string()))]
+    + [(column, pa.int32()) for column in LINE_COLUMNS]
+    + [("bytes", pa.int64())]
+)
+VALUE_COLUMNS = LINE_COLUMNS + ["bytes"]
+BREAKDOWN_SUFFIX = ".files.parquet"
+
+
+def _file_size(file_path):
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+def breakdown_table(repo_dir, file_counts):
+    # file_counts maps paths relative to repo_dir to [total, code, comment, empty], as count_files_by_path returns
+    paths = sorted(file_counts)
+    counts = np.array([file_counts[path] for path in paths], dtype=np.int32).reshape(-1, len(LINE_COLUMNS))
+    languages = [(language_for_path(path) or PLAIN_TEXT).name for path in paths]
+    sizes = np.array([_file_size(os.path.join(repo_dir, path)) for path in paths], dtype=np.int64)
+    return pa.Table.from_arrays(
+        [pa.array(paths, pa.string()), pa.array(languages, pa.string()).dictionary_encode().cast(BREAKDOWN_SCHEMA.field("language").type)]
+        + [pa.array(counts[:, i]) for i in range(len(LINE_COLUMNS))]
+        + [pa.array(sizes)],
+        schema=BREAKDOWN_SCHEMA,
+    )
+
+
+def save_breakdown(path, table, commit_sha, counter_version):
+    # Written to a temporary file first, so a reader never sees half a file
+    table = table.replace_schema_metadata({"commit": commit_sha, "counter_version": str(counter_version)})
+    temp_path = path + ".tmp"
+    pq.write_table(table, temp_path, compression="zstd")
+    os.replace(temp_path, path)
+
+
+def load_breakdown(path, columns=None):
+    # (table, commit, counter version) of a saved breakdown; raises OSError if there is none
+    table = pq.read_table(path, columns=columns)
+    metadata = table.schema.metadata or {}
+    counter_version = metadata.get(b"counter_version")
+    return table, metadata.get(b"commit", b"").decode(), int(counter_version) if counter_version else None
+
+
+def file_counts_from_table(table):
+    # The inverse of breakdown_table: {path: [total, code, comment, empty]}
+    counts = np.column_stack([table.column(column).to_numpy() for column in LINE_COLUMNS]).tolist()
+    return dict(zip(table.column("path").to_pylist(), counts))
+
+
+def load_breakdowns(paths_by_repository):
+    # One table of the saved breakdowns of several repositories. Paths are prefixed with the repository
+    # name, so the repositories are the top level of the tree; missing or unreadable files are skipped.
+    tables = []
+    for repository, path in paths_by_repository.items():
+        try:
+            table = load_breakdown(path)[0]
+        except (OSError, pa.ArrowException):
+            continue
+        table = table.set_column(0, "path", pc.binary_join_element_wise(repository, table.column("path"), "/"))
+        tables.append(table.replace_schema_metadata(None))
+    if not tables:
+        return BREAKDOWN_SCHEMA.empty_table()
+    return pa.concat_tables(tables, promote_options="permissive").unify_dictionaries()
+
+
+def under_directory(table, directory):
+    # Rows of the files below directory ("" for all of them)
+    if not directory:
+        return table
+    return table.filter(pc.starts_with(table.column("path"), directory + "/"))
+
+
+def directory_entries(table, directory=""):
+    # Totals per entry directly inside directory, like a file browser: one row per subdirectory
+    # (summed over everything below it) and per file
+    table = under_directory(table, directory)
+    remainder = pc.utf8_slice_codeunits(table.column("path"), len(directory) + 1 if directory else 0)
+    grouped = pa.table({
+        "name": pc.replace_substring_regex(remainder, pattern="/.*$", replacement=""),
+        "is_directory": pc.match_substring(remainder, "/"),
+        **{column: table.column(column) for column in VALUE_COLUMNS},
+    }).group_by(["name", "is_directory"]).aggregate(
+        [("name", "count")] + [(column, "sum") for column in VALUE_COLUMNS]
+    )
+    df = grouped.to_pandas().rename(columns={"name_count": "files", **{f"{column}_sum": column for column in VALUE_COLUMNS}})
+    return df.sort_values(["code_lines", "name"], ascending=[False, True], ignore_index=True)
+
+
+def language_totals(table):
+    grouped = table.group_by("language").aggregate([("path", "count")] + [(column, "sum") for column in VALUE_COLUMNS])
+    df = grouped.to_pandas().rename(columns={"path_count": "files", **{f"{column}_sum": column for column in VALUE_COLUMNS}})
+    df["language"] = df["language"].astype(str)
+    return df.sort_values("code_lines", ascending=False, ignore_index=True)
+
+
+def largest_files(table, limit=50, by="code_lines"):
+    df = table.take(pc.select_k_unstable(table, k=min(limit, table.num_rows), sort_keys=[(by, "descending")])).to_pandas()
+    df["language"] = df["language"].astype(str)
+    return df.sort_values([by, "path"], ascending=[False, True], ignore_index=True)
+
@@ -0,0 +1,135 @@
+import asyncio
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import SEARCH
+from result_cache import ResultCache
+
+# Search client for the GitHub REST API. Requests go through one pooled requests.Session and run in
+# worker threads so several result pages can be fetched concurrently from asyncio code. base_url can
+# point at a local mock server. With metrics set, the latency of every API request is recorded.
+GITHUB_API_URL = "https://api.github.com"
+DEFAULT_MAX_CONCURRENT_REQUESTS = 4
+DEFAULT_MAX_RETRIES = 3
+# Longer rate-limit waits fail fast instead of blocking the caller
+DEFAULT_MAX_RATE_LIMIT_WAIT_SECONDS = 60
+REQUEST_TIMEOUT_SECONDS = 30
+# Pages whose ETag is kept for conditional requests, least recently used dropped first
+DEFAULT_MAX_ETAG_ENTRIES = 512
+ETAG_CACHE_BYTES = 32 << 20
+ETAG_CACHE_SECONDS = 24 * 60 * 60
+
+
+class GitHubSearchError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class GitHubSearchClient:
+    def __init__(self, token=None, base_url=GITHUB_API_URL, max_concurrent_requests=DEFAULT_MAX_CONCURRENT_REQUESTS,
+                 max_retries=DEFAULT_MAX_RETRIES, max_rate_limit_wait=DEFAULT_MAX_RATE_LIMIT_WAIT_SECONDS, metrics=None,
+                 max_etag_entries=DEFAULT_MAX_ETAG_ENTRIES):
+        self.base_url = base_url.rstrip("/")
+        self.metrics = metrics
+        self.max_concurrent_requests = max_concurrent_requests
+        self.max_retries = max_retries
+        self.max_rate_limit_wait = max_rate_limit_wait
+
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=max_concurrent_requests))
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=max_concurrent_requests))
+        self.session.headers["Accept"] = "application/vnd.github+json"
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+
+        # (query, page, per_page) -> (etag, items); a 304 answer reuses the items and costs no rate limit.
+        # Bounded, since the client lives as long as the server.
+        self._etag_cache = ResultCache(
+            "etags", max_entries=max_etag_entries, max_bytes=ETAG_CACHE_BYTES, ttl_seconds=ETAG_CACHE_SECONDS
+        )
+        # Epoch seconds before which no request is sent because the rate limit is used up
+        self._rate_limited_until = 0
+
+    def _rate_limit_wait(self, response):
+        # Seconds to wait before retrying a rate-limited response, from Retry-After or X-RateLimit-Reset
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is not None:
+            return max(float(retry_after), 0)
+        if response.headers.get("X-RateLimit-Remaining") == "0":
+            reset = response.headers.get("X-RateLimit-Reset")
+            if reset is not None:
+                return max(float(reset) - time.time(), 0)
+        return None
+
+    def _record_rate_limit(self, response):
+        if response.headers.get("X-RateLimit-Remaining") == "0":
+            reset = response.headers.get("X-RateLimit-Reset")
+            if reset is not None:
+                self._rate_limited_until = max(self._rate_limited_until, float(reset))
+
+    async def _wait(self, seconds, status_code):
+        if seconds > self.max_rate_limit_wait:
+            raise GitHubSearchError(status_code, f"GitHub rate limit exceeded, retry in {int(seconds)} seconds")
+        await asyncio.sleep(seconds)
+
+    async def search(self, query, page, per_page=50):
+        key = (query, page, per_page)
+        params = {'q': query, 'page': page, 'per_page': per_page}
+
+        for attempt in range(self.max_retries + 1):
+            wait = self._rate_limited_until - time.time()
+            if wait > 0:
+                await self._wait(wait, 403)
+
+            headers = {}
+            cached = self._etag_cache.get(key)
+            if cached is not None:
+                headers["If-None-Match"] = cached[0]
+
+            start = time.perf_counter()
+            response = await asyncio.to_thread(
+                self.session.get, f"{self.base_url}/search/repositories",
+                params=params, headers=headers, timeout=REQUEST_TIMEOUT_SECONDS
+            )
+            if self.metrics is not None:
+                self.metrics.record_time(SEARCH, time.perf_counter() - start)
+            self._record_rate_limit(response)
+
+            if response.status_code == 304 and cached is not None:
+                return cached[1]
+            if response.status_code == 200:
+                items = response.json()['items']
+                etag = response.headers.get("ETag")
+                if etag:
+                    self._etag_cache.put(key, (etag, items))
+                return items
+
+            if attempt == self.max_retries:
+                break
+            if response.status_code in (403, 429):
+                wait = self._rate_limit_wait(response)
+                if wait is None:
+                    break  # A plain 403 (e.g. bad token) won't succeed on retry
+                await self._wait(wait, response.status_code)
+            elif response.status_code >= 500:
+                await asyncio.sleep(2 ** attempt)
+            else:
+                break
+
+        raise GitHubSearchError(response.status_code, f"Failed to retrieve repositories. Status code: {response.status_code}")
+
+    async def search_pages(self, query, pages, per_page=50):
+        # Fetches several pages at once, at most max_concurrent_requests in flight; results keep the order of pages
+        semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+
+        async def fetch(page):
+            async with semaphore:
+                return await self.search(query, page, per_page)
+
+        return await asyncio.gather(*(fetch(page) for page in pages))
+
+    def close(self):
+        self.session.close()
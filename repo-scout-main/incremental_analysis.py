@@ -0,0 +1,115 @@
+import os
+
+import pyarrow as pa
+from git import Repo
+
+import line_counter
+from file_breakdown import BREAKDOWN_SUFFIX, breakdown_table, file_counts_from_table, load_breakdown, save_breakdown
+from languages import language_for_path
+from source_filter import RULE_FILES, SourceFilter, load_rule_files
+
+# Per-file counts of a persisted clone are kept next to it (not inside the working tree)
+# so a refresh only has to recount the files that changed between two commits. Counts saved
+# by another COUNTER_VERSION are not reused. The file is the repository's file_breakdown table,
+# which the Favorites page aggregates.
+FILE_COUNTS_SUFFIX = BREAKDOWN_SUFFIX
+# Written before the counts were saved as Parquet; removed with the clone
+LEGACY_FILE_COUNTS_SUFFIX = ".counts.json"
+FETCH_TIMEOUT_SECONDS = 300
+
+
+def file_counts_path(repo_dir):
+    return os.path.normpath(repo_dir) + FILE_COUNTS_SUFFIX
+
+
+def load_file_counts(repo_dir):
+    try:
+        table, commit_sha, counter_version = load_breakdown(file_counts_path(repo_dir))
+    except (OSError, pa.ArrowException):
+        return None
+    return {"commit": commit_sha, "counter_version": counter_version, "files": file_counts_from_table(table)}
+
+
+def save_file_counts(repo_dir, commit_sha, file_counts):
+    save_breakdown(
+        file_counts_path(repo_dir), breakdown_table(repo_dir, file_counts), commit_sha, line_counter.COUNTER_VERSION
+    )
+
+
+def remove_file_counts(repo_dir):
+    for path in (file_counts_path(repo_dir), os.path.normpath(repo_dir) + LEGACY_FILE_COUNTS_SUFFIX):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def is_counted_path(relative_path):
+    return language_for_path(relative_path) is not None
+
+
+def load_source_filter(repo, repo_dir):
+    # A SourceFilter with every .gitignore and .gitattributes of the checked out commit
+    return load_rule_files(SourceFilter(), repo_dir, repo.git.ls_files("-z").split("\0"))
+
+
+def count_all_files(repo_dir, mode=line_counter.DEFAULT_COUNT_MODE):
+    # Stored with forward slashes to match the paths git diff reports
+    return line_counter.count_source_files_by_path(repo_dir, mode=mode)
+
+
+def get_changed_paths(repo, old_sha, new_sha):
+    # Returns (changed_or_added, deleted) paths between two commits; renames count as delete + add
+    output = repo.git.diff("--name-status", "--no-renames", "-z", old_sha, new_sha)
+    fields = output.split("\0")
+    changed_paths = []
+    deleted_paths = []
+    for status, path in zip(fields[0::2], fields[1::2]):
+        if status == "D":
+            deleted_paths.append(path)
+        else:
+            changed_paths.append(path)
+    return changed_paths, deleted_paths
+
+
+def refresh_repository(repo_dir, mode=line_counter.DEFAULT_COUNT_MODE, on_error=None):
+    # Fetches the remote HEAD into an existing clone and recounts only the files the new commit changed.
+    # Falls back to counting every file when no per-file counts were saved for the current commit.
+    # Returns (line_counts, new_sha, recounted_files).
+    repo = Repo(repo_dir)
+    old_sha = repo.head.commit.hexsha
+    saved = load_file_counts(repo_dir)
+
+    repo.git.fetch("--depth", "1", "origin", "HEAD", kill_after_timeout=FETCH_TIMEOUT_SECONDS)
+    new_sha = repo.git.rev_parse("FETCH_HEAD")
+
+    if new_sha != old_sha:
+        changed_paths, deleted_paths = get_changed_paths(repo, old_sha, new_sha)
+        repo.git.reset("--hard", new_sha)
+    else:
+        changed_paths, deleted_paths = [], []
+
+    # Changed ignore rules or attributes can change which unchanged files are counted
+    rules_changed = any(path.rpartition("/")[2] in RULE_FILES for path in deleted_paths + changed_paths)
+    if (saved is not None and saved.get("commit") == old_sha and not rules_changed
+            and saved.get("counter_version") == line_counter.COUNTER_VERSION):
+        file_counts = saved["files"]
+        for path in deleted_paths + changed_paths:
+            file_counts.pop(path, None)
+        source_filter = load_source_filter(repo, repo_dir)
+        changed_paths = [
+            path for path in changed_paths
+            if is_counted_path(path)
+            and not source_filter.skips_file_on_disk(os.path.join(repo_dir, path), path, check_directories=True)
+        ]
+        new_counts, errors = line_counter.count_files_by_path(repo_dir, changed_paths, mode=mode)
+        file_counts.update(new_counts)
+        recounted_files = len(changed_paths)
+    else:
+        file_counts, errors = count_all_files(repo_dir, mode=mode)
+        recounted_files = len(file_counts)
+
+    if on_error is not None:
+        for file_path, message in errors:
+            on_error(file_path, message)
+
+    save_file_counts(repo_dir, new_sha, file_counts)
+    return line_counter.format_line_counts(line_counter.sum_file_counts(file_counts)), new_sha, recounted_files
@@ -0,0 +1,96 @@
+import os
+from collections import namedtuple
+
+# Table of the languages count_lines_of_code recognises. Each entry lists its file extensions
+# (matched case-sensitively, like the sparse-checkout patterns built from them), whole file
+# names, line comment prefixes, (open, close) block comment pairs, and string delimiters:
+# `strings` end at the end of the line, `multiline_strings` may span lines. Delimiters are
+# tried longest first, so "--[[" wins over "--" and '"""' over '"'.
+Language = namedtuple(
+    "Language",
+    ["name", "extensions", "line_comments", "block_comments", "strings", "multiline_strings", "filenames"],
+    defaults=((), (), ('"', "'"), (), ()),
+)
+
+_C_BLOCK = (("/*", "*/"),)
+_HTML_BLOCK = (("<!--", "-->"),)
+
+LANGUAGES = (
+    # C family
+    Language("C", (".c", ".h"), ("//",), _C_BLOCK),
+    Language("C++", (".cpp", ".cc", ".cxx", ".hpp", ".hh", ".hxx", ".ino"), ("//",), _C_BLOCK),
+    Language("C#", (".cs",), ("//",), _C_BLOCK),
+    Language("Objective-C", (".m", ".mm"), ("//",), _C_BLOCK),
+    Language("Java", (".java",), ("//",), _C_BLOCK),
+    Language("Kotlin", (".kt", ".kts"), ("//",), _C_BLOCK, multiline_strings=('"""',)),
+    Language("Scala", (".scala", ".sc"), ("//",), _C_BLOCK, multiline_strings=('"""',)),
+    Language("Groovy", (".groovy", ".gradle"), ("//",), _C_BLOCK, multiline_strings=('"""', "'''")),
+    Language("Swift", (".swift",), ("//",), _C_BLOCK, multiline_strings=('"""',)),
+    Language("Dart", (".dart",), ("//",), _C_BLOCK, multiline_strings=('"""', "'''")),
+    Language("Go", (".go",), ("//",), _C_BLOCK, multiline_strings=("`",)),
+    # Only '"' strings: a "'" is as often a lifetime or a loop label as a char literal
+    Language("Rust", (".rs",), ("//",), _C_BLOCK, strings=('"',)),
+    Language("Zig", (".zig",), ("//",), strings=('"',)),
+    Language("Solidity", (".sol",), ("//",), _C_BLOCK),
+    Language("JavaScript", (".js", ".mjs", ".cjs", ".jsx"), ("//",), _C_BLOCK, multiline_strings=("`",)),
+    Language("TypeScript", (".ts", ".mts", ".cts", ".tsx"), ("//",), _C_BLOCK, multiline_strings=("`",)),
+    Language("PHP", (".php",), ("//", "#"), _C_BLOCK),
+    Language("Protocol Buffers", (".proto",), ("//",), _C_BLOCK),
+    Language("GLSL", (".glsl", ".vert", ".frag"), ("//",), _C_BLOCK),
+    Language("Verilog", (".v", ".sv", ".svh"), ("//",), _C_BLOCK, strings=('"',)),
+    Language("Terraform", (".tf", ".hcl"), ("#", "//"), _C_BLOCK, strings=('"',)),
+    # Web
+    Language("HTML", (".html", ".htm", ".xhtml"), (), _HTML_BLOCK, strings=()),
+    Language("XML", (".xml", ".xsd", ".xsl", ".xslt", ".plist"), (), _HTML_BLOCK, strings=()),
+    Language("Vue", (".vue",), ("//",), _HTML_BLOCK + _C_BLOCK, strings=()),
+    Language("Svelte", (".svelte",), ("//",), _HTML_BLOCK + _C_BLOCK, strings=()),
+    Language("CSS", (".css",), (), _C_BLOCK),
+    Language("SCSS", (".scss", ".sass"), ("//",), _C_BLOCK),
+    Language("Less", (".less",), ("//",), _C_BLOCK),
+    # Scripting
+    Language("Python", (".py", ".pyw", ".pyi"), ("#",), multiline_strings=('"""', "'''")),
+    Language("Ruby", (".rb", ".rake", ".gemspec"), ("#",), (("=begin", "=end"),), filenames=("Rakefile", "Gemfile")),
+    Language("Perl", (".pl", ".pm"), ("#",)),
+    Language("Shell", (".sh", ".bash", ".zsh", ".ksh"), ("#",)),
+    Language("PowerShell", (".ps1", ".psm1", ".psd1"), ("#",), (("<#", "#>"),)),
+    Language("Lua", (".lua",), ("--",), (("--[[", "]]"),)),
+    Language("R", (".r", ".R"), ("#",)),
+    Language("Julia", (".jl",), ("#",), (("#=", "=#"),), strings=('"',), multiline_strings=('"""',)),
+    Language("Elixir", (".ex", ".exs"), ("#",), multiline_strings=('"""', "'''")),
+    Language("Erlang", (".erl", ".hrl"), ("%",)),
+    Language("Tcl", (".tcl",), ("#",), strings=('"',)),
+    # Functional
+    Language("Haskell", (".hs", ".lhs"), ("--",), (("{-", "-}"),), strings=('"',)),
+    Language("Elm", (".elm",), ("--",), (("{-", "-}"),), strings=('"',), multiline_strings=('"""',)),
+    Language("OCaml", (".ml", ".mli"), (), (("(*", "*)"),), strings=('"',)),
+    Language("F#", (".fs", ".fsi", ".fsx"), ("//",), (("(*", "*)"),), strings=('"',), multiline_strings=('"""',)),
+    Language("Clojure", (".clj", ".cljs", ".cljc", ".edn"), (";",), strings=('"',)),
+    Language("Lisp", (".lisp", ".lsp", ".el", ".scm"), (";",), (("#|", "|#"),), strings=('"',)),
+    # Data, build and query languages
+    Language("SQL", (".sql",), ("--",), _C_BLOCK, strings=("'",)),
+    Language("Visual Basic", (".vb", ".bas"), ("'",), strings=('"',)),
+    Language("Fortran", (".f90", ".f95", ".f03"), ("!",)),
+    Language("Assembly", (".asm", ".s", ".S"), (";", "#"), strings=('"',)),
+    Language("YAML", (".yml", ".yaml"), ("#",)),
+    Language("TOML", (".toml",), ("#",), multiline_strings=('"""', "'''")),
+    Language("Makefile", (".mk",), ("#",), strings=(), filenames=("Makefile", "makefile", "GNUmakefile")),
+    Language("CMake", (".cmake",), ("#",), strings=('"',), filenames=("CMakeLists.txt",)),
+    Language("Dockerfile", (".dockerfile",), ("#",), strings=(), filenames=("Dockerfile",)),
+)
+
+# Files of unknown type that are counted anyway (e.g. through count_files_by_path) have no comments
+PLAIN_TEXT = Language("Text", (), strings=())
+
+LANGUAGES_BY_EXTENSION = {extension: language for language in LANGUAGES for extension in language.extensions}
+LANGUAGES_BY_FILENAME = {filename: language for language in LANGUAGES for filename in language.filenames}
+SOURCE_EXTENSIONS = tuple(LANGUAGES_BY_EXTENSION)
+SOURCE_FILENAMES = tuple(LANGUAGES_BY_FILENAME)
+
+
+def language_for_path(path):
+    # The Language of a file path, or None for files that are not counted
+    filename = os.path.basename(path)
+    language = LANGUAGES_BY_FILENAME.get(filename)
+    if language is None:
+        language = LANGUAGES_BY_EXTENSION.get(os.path.splitext(filename)[1])
+    return language
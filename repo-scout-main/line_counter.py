@@ -0,0 +1,644 @@
+import os
+import re
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+
+import numpy as np
+
+from languages import PLAIN_TEXT, language_for_path
+from source_filter import RULE_FILES, SourceFilter, load_rule_files
+
+# This module has no Streamlit imports so process-pool workers can import it
+# without re-running the app script.
+
+# Bumped whenever the same repository may be counted differently, so cached and saved counts are recomputed
+COUNTER_VERSION = 3
+
+# Files are read this many bytes at a time by the byte-level counter
+READ_CHUNK_SIZE = 1 << 20
+# Blocks smaller than this are classified with a plain loop, numpy's per-call overhead dominates below it
+SMALL_BLOCK_SIZE = 4096
+# The ASCII bytes str.strip() removes; bytes.strip() alone would keep \x1c-\x1f
+_WHITESPACE_CHARS = b'\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f '
+
+# Repositories with fewer matching files than this are counted in the calling process
+PARALLEL_COUNT_THRESHOLD = 2000
+# Number of files handed to a worker process at a time
+FILES_PER_CHUNK = 500
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def get_process_pool():
+    # One pool is shared by every caller, so concurrent repository analyses don't each spawn their own
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"))
+        return _process_pool
+
+
+def find_source_files(directory, source_filter=None):
+    # Files of a registered language that source_filter (by default one with the standard rules) keeps.
+    # Skipped directories are never entered, and the repository's rule files are picked up on the way down.
+    if source_filter is None:
+        source_filter = SourceFilter()
+    source_files = []
+    for root, directories, files in os.walk(directory):
+        relative_root = os.path.relpath(root, directory).replace(os.sep, "/")
+        prefix = "" if relative_root == "." else relative_root + "/"
+        load_rule_files(source_filter, directory, [prefix + file for file in files if file in RULE_FILES])
+        directories[:] = [name for name in directories if not source_filter.skips_directory(prefix + name)]
+        for file in files:
+            if language_for_path(file) is None:
+                continue
+            file_path = os.path.join(root, file)
+            if not source_filter.skips_file_on_disk(file_path, prefix + file):
+                source_files.append(file_path)
+    return source_files
+
+
+def empty_counts():
+    return {
+        "total_lines": 0,
+        "code_lines": 0,
+        "comment_lines": 0,
+        "empty_lines": 0,
+        "files": 0,
+        # Code lines per language name
+        "language_lines": {},
+        "errors": [],
+    }
+
+
+def _until(delimiter, escapes):
+    # Regex for everything up to and including delimiter, or to the end of the text if it never comes.
+    # Written as "unrolled loops" of character classes, which re scans far faster than an alternation per
+    # character. With escapes a backslash skips the next character, and the text may end in a lone one.
+    first = re.escape(delimiter[0])
+    rest = re.escape(delimiter[1:])
+    excluded = first + ("\\\\" if escapes else "")
+    skips = []
+    if escapes:
+        skips.append("\\\\.")
+    if rest:
+        skips.append(f"{first}(?!{rest})")
+    body = f"[^{excluded}]*"
+    if skips:
+        body += f"(?:(?:{'|'.join(skips)})[^{excluded}]*)*"
+    end = "\\\\?\\Z" if escapes else "\\Z"
+    return f"{body}(?:{re.escape(delimiter)}|{end})"
+
+
+def _rule_body(kind, opener, closer):
+    # Regex for the rest of a comment or string after its opener
+    if kind == "block":
+        return _until(closer, escapes=False)
+    if kind == "line":
+        return "[^\\n]*"
+    if kind == "multiline_string":
+        return _until(opener, escapes=True)
+    # A plain string ends at its closing quote or, unclosed, at the end of the line
+    first = re.escape(opener)
+    return f"[^{first}\\\\\\n]*(?:\\\\[^\\n][^{first}\\\\\\n]*)*{first}?"
+
+
+class _Classifier:
+    # A language's comment and string rules compiled into one tokenizing regex per text type. Only the
+    # comment spans it finds are kept: a line is a comment line when every non-whitespace character of
+    # it lies inside a comment, strings only matter for hiding comment delimiters.
+    def __init__(self, language):
+        self.line_prefixes = language.line_comments
+        self.line_prefixes_bytes = tuple(prefix.encode() for prefix in language.line_comments)
+        # Constructs that can span lines; a block without any of them needs no tokenizing
+        self.openers = tuple(opener for opener, _ in language.block_comments) + language.multiline_strings
+        self.openers_bytes = tuple(opener.encode() for opener in self.openers)
+        self.block_openers_bytes = tuple(opener.encode() for opener, _ in language.block_comments)
+        self.multiline_strings_bytes = tuple(delimiter.encode() for delimiter in language.multiline_strings)
+        # One-byte multi-line string delimiters such as JavaScript's backtick, and the bytes that can start
+        # any construct or escape; see multiline_regions
+        self.one_byte_strings = tuple(delimiter[0] for delimiter in self.multiline_strings_bytes if len(delimiter) == 1)
+
+        rules = [("block", opener, closer) for opener, closer in language.block_comments]
+        rules += [("line", prefix, None) for prefix in language.line_comments]
+        rules += [("multiline_string", delimiter, None) for delimiter in language.multiline_strings]
+        rules += [("string", delimiter, None) for delimiter in language.strings]
+        # Longest delimiter first, so "--[[" is not read as "--" and '"""' not as '"'
+        rules.sort(key=lambda rule: -len(rule[1]))
+
+        self.comment_groups = set()
+        self.multiline_groups = set()
+        alternatives = []
+        constructs = []
+        self.resume = {}
+        self.resume_bytes = {}
+        for index, (kind, opener, closer) in enumerate(rules):
+            group = f"r{index}"
+            body = _rule_body(kind, opener, closer)
+            # Every alternative starts with a plain character, which lets re skip ahead to the next
+            # position where any of them could match instead of trying each one at every position
+            alternatives.append(f"{re.escape(opener[0])}(?P<{group}>{re.escape(opener[1:])}{body})")
+            constructs.append(f"{re.escape(opener)}{body}")
+            if kind in ("block", "line"):
+                self.comment_groups.add(group)
+            if kind in ("block", "multiline_string"):
+                self.multiline_groups.add(group)
+                # Continues a construct left open at the end of the previous block
+                self.resume[group] = re.compile(body, re.DOTALL)
+                self.resume_bytes[group] = re.compile(body.encode(), re.DOTALL)
+        self.special_bytes = tuple(sorted({ord(opener[0]) for _, opener, _ in rules} | {ord("\\")}))
+        source = "|".join(alternatives) or "(?!)"
+        self.pattern = re.compile(source, re.DOTALL)
+        self.pattern_bytes = re.compile(source.encode(), re.DOTALL)
+
+        # Matches from a line start through the first line break that is outside every comment and
+        # string, stepping over whole constructs, so one match finds the end of a multi-line region
+        starts = "".join(sorted({re.escape(opener[0]) for _, opener, _ in rules}))
+        run = f"(?:[^\\n{starts}]+|{'|'.join(constructs)}|[{starts}])*\\n?" if rules else "[^\\n]*\\n?"
+        self.line_run_pattern = re.compile(run.encode(), re.DOTALL)
+
+    def needs_tokens(self, text, state):
+        if state is not None:
+            return True
+        openers = self.openers_bytes if isinstance(text, bytes) else self.openers
+        return any(opener in text for opener in openers)
+
+    def comment_spans(self, text, state=None):
+        # Returns the (start, end) offsets of the comments in text and the open multi-line construct
+        # text ends in, if any, which is passed as state for the next block of the same file
+        is_bytes = isinstance(text, bytes)
+        ends_with_newline = text.endswith(b'\n' if is_bytes else '\n')
+        spans = []
+        position = 0
+        if state is not None:
+            position = (self.resume_bytes if is_bytes else self.resume)[state].match(text).end()
+            if state in self.comment_groups:
+                spans.append((0, position))
+            if position == len(text) and ends_with_newline:
+                return spans, state
+
+        match = None
+        for match in (self.pattern_bytes if is_bytes else self.pattern).finditer(text, position):
+            if match.lastgroup in self.comment_groups:
+                spans.append(match.span())
+        if (match is not None and match.end() == len(text) and ends_with_newline
+                and match.lastgroup in self.multiline_groups):
+            return spans, match.lastgroup
+        return spans, None
+
+    def _drop_closed_string_lines(self, buf, line_starts, line_ends, opener_lines, has_block_opener):
+        # Drops the lines whose only special bytes are an even number of one one-byte string delimiter,
+        # e.g. `${a}` in JavaScript: every string they open is closed on the same line, so they need no
+        # tokenizing. This saves a regex match per line in code full of template literals.
+        special = buf == self.special_bytes[0]
+        for byte in self.special_bytes[1:]:
+            special |= buf == byte
+        special_positions = np.flatnonzero(special)
+        starts = line_starts[opener_lines]
+        ends = line_ends[opener_lines]
+        specials = np.searchsorted(special_positions, ends) - np.searchsorted(special_positions, starts)
+        closed = np.zeros(len(opener_lines), dtype=bool)
+        for delimiter in self.one_byte_strings:
+            positions = special_positions[buf[special_positions] == delimiter]
+            count = np.searchsorted(positions, ends) - np.searchsorted(positions, starts)
+            closed |= (count == specials) & (count % 2 == 0)
+        # The last line may be cut off by the end of the block, the loop below handles it
+        closed &= ~has_block_opener[opener_lines] & (opener_lines < len(line_ends) - 1)
+        return opener_lines[~closed]
+
+    def multiline_regions(self, block, state=None):
+        # Line-aligned (start, end) ranges of a bytes block covering every multi-line comment or string
+        # and the lines they start and end on. Only these ranges need tokenizing: any other line starts
+        # outside a comment, so the line comment prefix rule classifies it exactly. Every range starts and
+        # ends outside any comment or string (bar one continuing state or left open at the end of block),
+        # so the ranges can be joined and tokenized as one text.
+        regions = []
+        position = 0
+        if state is not None:
+            position = self.resume_bytes[state].match(block).end()
+            position = self.line_run_pattern.match(block, position).end()
+            regions.append((0, position))
+        buf = np.frombuffer(block, dtype=np.uint8)
+        line_ends = np.append(np.flatnonzero(buf == 10), len(block))
+        line_starts = np.concatenate(([0], line_ends[:-1] + 1))
+        block_positions = [_find_all(buf, opener) for opener in self.block_openers_bytes]
+        string_positions = [_find_all(buf, delimiter) for delimiter in self.multiline_strings_bytes]
+        opener_lines = np.unique(np.searchsorted(line_ends, np.concatenate(block_positions + string_positions)))
+        has_block_opener = np.zeros(len(line_ends), dtype=bool)
+        for positions in block_positions:
+            has_block_opener[np.searchsorted(line_ends, positions)] = True
+        if self.one_byte_strings and len(opener_lines):
+            opener_lines = self._drop_closed_string_lines(buf, line_starts, line_ends, opener_lines, has_block_opener)
+
+        for start, end, block_opener in zip(line_starts[opener_lines].tolist(), line_ends[opener_lines].tolist(),
+                                            has_block_opener[opener_lines].tolist()):
+            # Lines inside the previous region were already stepped over
+            if start < position:
+                continue
+            position = self.line_run_pattern.match(block, start).end()
+            # A string opened and closed on one line without any block comment leaves the prefix rule exact
+            if position == end + 1 < len(block) and not block_opener:
+                continue
+            regions.append((start, position))
+        return regions
+
+
+@lru_cache(maxsize=None)
+def get_classifier(language):
+    return _Classifier(language)
+
+
+def _classify_lines_loop(text, prefixes, spans=None):
+    # Classifies the lines of text (str, or bytes holding only ASCII) and returns (total, code, comment, empty).
+    # Without spans a line is a comment when it starts with one of prefixes, which is exact for text
+    # without multi-line constructs; otherwise when all its non-whitespace characters lie in spans.
+    if isinstance(text, str):
+        newline, whitespace = '\n', None
+    else:
+        newline, whitespace = b'\n', _WHITESPACE_CHARS
+    total_lines = 0
+    code_lines = 0
+    comment_lines = 0
+    empty_lines = 0
+    span_index = 0
+    start = 0
+    while start < len(text):
+        end = text.find(newline, start)
+        if end < 0:
+            end = len(text)
+        line = text[start:end]
+        stripped_line = line.strip(whitespace)
+        total_lines += 1
+        if not stripped_line:
+            empty_lines += 1
+        elif spans is None:
+            if stripped_line.startswith(prefixes):
+                comment_lines += 1
+            else:
+                code_lines += 1
+        else:
+            first = start + len(line) - len(line.lstrip(whitespace))
+            last = first + len(stripped_line)
+            while span_index < len(spans) and spans[span_index][1] <= first:
+                span_index += 1
+            # Step over the comments covering the line and the whitespace between them
+            position = first
+            index = span_index
+            while index < len(spans) and spans[index][0] <= position < last:
+                position = spans[index][1]
+                if position < last:
+                    position = last - len(text[position:last].lstrip(whitespace))
+                index += 1
+            if position >= last:
+                comment_lines += 1
+            else:
+                code_lines += 1
+        start = end + 1
+    return total_lines, code_lines, comment_lines, empty_lines
+
+
+def _content_bytes(buf):
+    # Mask of the bytes that are not in _WHITESPACE_CHARS; comparisons are much faster than a table lookup
+    return (buf > 32) | (buf < 9) | ((buf > 13) & (buf < 28))
+
+
+def _first_in_lines(mask, line_starts):
+    # Offset of the first set byte at or after each line start, len(mask) if there is none. Newlines are
+    # never set, so a line's first set byte always starts a run and only run starts need searching.
+    run_starts = np.flatnonzero(mask[1:] & ~mask[:-1]) + 1
+    if mask[0]:
+        run_starts = np.concatenate(([0], run_starts))
+    run_starts = np.append(run_starts, len(mask))
+    return run_starts[np.searchsorted(run_starts, line_starts)]
+
+
+def _find_all(buf, needle):
+    # Start offsets of every occurrence of needle (bytes) in buf
+    if len(buf) < len(needle):
+        return np.zeros(0, dtype=np.intp)
+    stop = len(buf) - len(needle) + 1
+    matches = buf[:stop] == needle[0]
+    for k in range(1, len(needle)):
+        matches &= buf[k:stop + k] == needle[k]
+    return np.flatnonzero(matches)
+
+
+def _classify_prefixes(block, classifier):
+    # numpy version of the prefix case of _classify_lines_loop for bytes ending in a line break: it finds
+    # each line's first non-whitespace byte and matches the line comment prefixes there
+    buf = np.frombuffer(block, dtype=np.uint8)
+    line_ends = np.flatnonzero(buf == 10)
+    line_starts = np.concatenate(([0], line_ends[:-1] + 1))
+    content = _content_bytes(buf)
+
+    first = _first_in_lines(content, line_starts)
+    non_empty = first < line_ends
+    first = first[non_empty]
+    total_lines = len(line_ends)
+    empty_lines = total_lines - len(first)
+    comment_lines = 0
+
+    if not block.isascii():
+        # A line starting or ending with a non-ASCII byte may start or end with Unicode whitespace
+        # (e.g. U+00A0), which only str.strip() removes, so those few lines are decoded and stripped as str
+        non_whitespace = np.flatnonzero(content)
+        last = non_whitespace[np.searchsorted(non_whitespace, line_ends[non_empty]) - 1]
+        unicode_edges = (buf[first] >= 0x80) | (buf[last] >= 0x80)
+        for start, end in zip(line_starts[non_empty][unicode_edges], line_ends[non_empty][unicode_edges]):
+            stripped_line = block[start:end].decode('utf-8').strip()
+            if not stripped_line:
+                empty_lines += 1
+            elif stripped_line.startswith(classifier.line_prefixes):
+                comment_lines += 1
+        first = first[~unicode_edges]
+
+    is_comment = np.zeros(len(first), dtype=bool)
+    for prefix in classifier.line_prefixes_bytes:
+        # A prefix running past its line meets the newline first, and the block ends in one, so
+        # clipping to the last byte never creates a match
+        matches = buf[first] == prefix[0]
+        for k in range(1, len(prefix)):
+            matches &= buf[np.minimum(first + k, len(buf) - 1)] == prefix[k]
+        is_comment |= matches
+    comment_lines += int(np.count_nonzero(is_comment))
+
+    code_lines = total_lines - empty_lines - comment_lines
+    return total_lines, code_lines, comment_lines, empty_lines
+
+
+def _classify_spans(block, spans):
+    # numpy version of the spans case of _classify_lines_loop, for ASCII bytes ending in a line break:
+    # a non-empty line is code when it has a non-whitespace byte outside every comment span
+    buf = np.frombuffer(block, dtype=np.uint8)
+    line_ends = np.flatnonzero(buf == 10)
+    line_starts = np.concatenate(([0], line_ends[:-1] + 1))
+    content = _content_bytes(buf)
+
+    # +1 where a comment starts and -1 where it ends; spans never overlap, but one may end where the next starts
+    edges = np.zeros(len(buf) + 1, dtype=np.int8)
+    if spans:
+        bounds = np.array(spans)
+        edges[bounds[:, 0]] += 1
+        edges[bounds[:, 1]] -= 1
+    code = content & (np.cumsum(edges[:-1]) == 0)
+
+    total_lines = len(line_ends)
+    non_empty_lines = int(np.count_nonzero(_first_in_lines(content, line_starts) < line_ends))
+    code_lines = int(np.count_nonzero(_first_in_lines(code, line_starts) < line_ends))
+    return total_lines, code_lines, non_empty_lines - code_lines, total_lines - non_empty_lines
+
+
+def _classify_lines_small(block, classifier, state=None):
+    # _classify_lines_loop on a bytes block, tokenizing it if it may hold multi-line constructs
+    text = block if block.isascii() else block.decode('utf-8')
+    prefixes = classifier.line_prefixes_bytes if text is block else classifier.line_prefixes
+    spans = None
+    if classifier.needs_tokens(text, state):
+        spans, state = classifier.comment_spans(text, state)
+    return _classify_lines_loop(text, prefixes, spans), state
+
+
+def _classify_lines(block, classifier, state=None):
+    # Classifies the lines in block (bytes) and returns ((total, code, comment, empty), state), where
+    # state is the multi-line comment or string block ends in. In large blocks only the regions around
+    # multi-line constructs go through the loop, the remaining lines are handled with numpy.
+    if b'\r' in block:
+        block = block.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+    if len(block) < SMALL_BLOCK_SIZE:
+        return _classify_lines_small(block, classifier, state)
+    if not classifier.needs_tokens(block, state):
+        return _classify_prefixes(_with_final_newline(block), classifier), None
+
+    regions = classifier.multiline_regions(block, state)
+    counts = (0, 0, 0, 0)
+    end_state = None
+    if regions:
+        region_text = b''.join([block[start:end] for start, end in regions])
+        if region_text.isascii():
+            spans, end_state = classifier.comment_spans(region_text, state)
+            counts = _classify_spans(_with_final_newline(region_text), spans)
+        else:
+            counts, end_state = _classify_lines_small(region_text, classifier, state)
+
+    rest = []
+    previous = 0
+    for start, end in regions:
+        rest.append(block[previous:start])
+        previous = end
+    rest.append(block[previous:])
+    rest = b''.join(rest)
+    if rest:
+        counts = [total + count for total, count in zip(counts, _classify_prefixes(_with_final_newline(rest), classifier))]
+    return tuple(counts), end_state
+
+
+def _with_final_newline(block):
+    return block if block.endswith(b'\n') else block + b'\n'
+
+
+def count_file(file_path, language=None):
+    # Returns (total, code, comment, empty) for one file; raises UnicodeDecodeError for non UTF-8 files.
+    # language defaults to the one registered for the file's name.
+    classifier = get_classifier(language or language_for_path(file_path) or PLAIN_TEXT)
+    with open(file_path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    spans = None
+    if classifier.needs_tokens(text, None):
+        spans, _ = classifier.comment_spans(text)
+    return _classify_lines_loop(text, classifier.line_prefixes, spans)
+
+
+def count_file_bytes(file_path, chunk_size=READ_CHUNK_SIZE, language=None):
+    # Same totals as count_file, but reads raw bytes in large chunks instead of decoding every line.
+    # Chunks are cut at the last line break so multi-byte characters and \r\n pairs are never split;
+    # a comment or string still open at the end of a chunk carries over to the next.
+    classifier = get_classifier(language or language_for_path(file_path) or PLAIN_TEXT)
+    total_lines = 0
+    code_lines = 0
+    comment_lines = 0
+    empty_lines = 0
+    state = None
+    pending = b''
+    with open(file_path, 'rb') as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            buffer = pending + data
+            # A trailing \r may be the first half of a \r\n split across chunks
+            end = len(buffer) - 1 if buffer.endswith(b'\r') else len(buffer)
+            cut = max(buffer.rfind(b'\n', 0, end), buffer.rfind(b'\r', 0, end))
+            if cut < 0:
+                pending = buffer
+                continue
+            block = buffer[:cut + 1]
+            pending = buffer[cut + 1:]
+            if not block.isascii():
+                block.decode('utf-8')  # Raises UnicodeDecodeError like the text reader would
+            counts, state = _classify_lines(block, classifier, state)
+            total_lines += counts[0]
+            code_lines += counts[1]
+            comment_lines += counts[2]
+            empty_lines += counts[3]
+
+    if pending:
+        if not pending.isascii():
+            pending.decode('utf-8')
+        counts, _ = _classify_lines(pending, classifier, state)
+        total_lines += counts[0]
+        code_lines += counts[1]
+        comment_lines += counts[2]
+        empty_lines += counts[3]
+
+    return total_lines, code_lines, comment_lines, empty_lines
+
+
+def count_bytes(data, language=PLAIN_TEXT):
+    # count_file_bytes for content that is already in memory, e.g. a blob read from the git object database
+    if not data:
+        return 0, 0, 0, 0
+    if not data.isascii():
+        data.decode('utf-8')  # Raises UnicodeDecodeError like the text reader would
+    counts, _ = _classify_lines(data, get_classifier(language))
+    return counts
+
+
+# "text" decodes the whole file and classifies it line by line; "bytes" is the faster byte-level path with identical totals
+COUNT_MODES = {
+    "text": count_file,
+    "bytes": count_file_bytes,
+}
+DEFAULT_COUNT_MODE = "bytes"
+
+
+def _add_file_counts(counts, language, file_counts):
+    total_lines, code_lines, comment_lines, empty_lines = file_counts
+    counts["total_lines"] += total_lines
+    counts["code_lines"] += code_lines
+    counts["comment_lines"] += comment_lines
+    counts["empty_lines"] += empty_lines
+    counts["files"] += 1
+    counts["language_lines"][language.name] = counts["language_lines"].get(language.name, 0) + code_lines
+
+
+def count_files(file_paths, mode=DEFAULT_COUNT_MODE):
+    count_one_file = COUNT_MODES[mode]
+    counts = empty_counts()
+    for file_path in file_paths:
+        language = language_for_path(file_path) or PLAIN_TEXT
+        try:
+            file_counts = count_one_file(file_path, language=language)
+        except UnicodeDecodeError:
+            continue
+        except Exception as e:
+            counts["errors"].append((file_path, str(e)))
+            continue
+        _add_file_counts(counts, language, file_counts)
+    return counts
+
+
+def merge_counts(partial_counts):
+    merged = empty_counts()
+    for counts in partial_counts:
+        merged["total_lines"] += counts["total_lines"]
+        merged["code_lines"] += counts["code_lines"]
+        merged["comment_lines"] += counts["comment_lines"]
+        merged["empty_lines"] += counts["empty_lines"]
+        merged["files"] += counts["files"]
+        for language_name, lines in counts["language_lines"].items():
+            merged["language_lines"][language_name] = merged["language_lines"].get(language_name, 0) + lines
+        merged["errors"].extend(counts["errors"])
+    return merged
+
+
+def count_files_by_path(directory, relative_paths, mode=DEFAULT_COUNT_MODE):
+    # Per-file [total, code, comment, empty] keyed by path relative to directory, plus any read errors
+    count_one_file = COUNT_MODES[mode]
+    file_counts = {}
+    errors = []
+    for relative_path in relative_paths:
+        file_path = os.path.join(directory, relative_path)
+        try:
+            file_counts[relative_path] = list(count_one_file(file_path))
+        except UnicodeDecodeError:
+            continue
+        except Exception as e:
+            errors.append((file_path, str(e)))
+    return file_counts, errors
+
+
+def count_files_by_path_in_parallel(directory, relative_paths, mode=DEFAULT_COUNT_MODE, files_per_chunk=FILES_PER_CHUNK):
+    chunks = [relative_paths[i:i + files_per_chunk] for i in range(0, len(relative_paths), files_per_chunk)]
+    file_counts = {}
+    errors = []
+    for chunk_file_counts, chunk_errors in get_process_pool().map(partial(count_files_by_path, directory, mode=mode), chunks):
+        file_counts.update(chunk_file_counts)
+        errors.extend(chunk_errors)
+    return file_counts, errors
+
+
+def count_source_files_by_path(directory, parallel_threshold=PARALLEL_COUNT_THRESHOLD, mode=DEFAULT_COUNT_MODE):
+    # count_files_by_path for every file find_source_files keeps, with "/" separated relative paths
+    relative_paths = [
+        os.path.relpath(file_path, directory).replace(os.sep, "/") for file_path in find_source_files(directory)
+    ]
+    if len(relative_paths) >= parallel_threshold:
+        return count_files_by_path_in_parallel(directory, relative_paths, mode=mode)
+    return count_files_by_path(directory, relative_paths, mode=mode)
+
+
+def sum_file_counts(file_counts):
+    counts = empty_counts()
+    for relative_path, counts_of_file in file_counts.items():
+        _add_file_counts(counts, language_for_path(relative_path) or PLAIN_TEXT, counts_of_file)
+    return counts
+
+
+def count_files_in_parallel(file_paths, mode=DEFAULT_COUNT_MODE, files_per_chunk=FILES_PER_CHUNK):
+    chunks = [file_paths[i:i + files_per_chunk] for i in range(0, len(file_paths), files_per_chunk)]
+    return merge_counts(get_process_pool().map(partial(count_files, mode=mode), chunks))
+
+
+def format_line_counts(counts):
+    language_lines = counts["language_lines"]
+    return {
+        "total_lines": counts["total_lines"],
+        "java_lines": language_lines.get("Java", 0),
+        "python_lines": language_lines.get("Python", 0),
+        "javascript_lines": language_lines.get("JavaScript", 0),
+        "rust_lines": language_lines.get("Rust", 0),
+        "css_lines": language_lines.get("CSS", 0),
+        "html_lines": language_lines.get("HTML", 0),
+        "total_lines_without_spaces_or_comments": counts["code_lines"],
+        "comment_lines": counts["comment_lines"],
+        "empty_lines": counts["empty_lines"],
+        "files_counted": counts["files"],
+        # Code lines of every language that had at least one counted file, by language name
+        "language_lines": dict(sorted(language_lines.items())),
+    }
+
+
+def count_lines_of_code(directory, parallel_threshold=PARALLEL_COUNT_THRESHOLD, on_error=None, mode=DEFAULT_COUNT_MODE,
+                        file_counts=None):
+    # Small repositories are counted in-process; large ones are split across the shared process pool.
+    # A file_counts dict is filled with the counts of every file by relative path, like count_files_by_path.
+    if file_counts is not None:
+        counted_files, errors = count_source_files_by_path(directory, parallel_threshold, mode=mode)
+        file_counts.update(counted_files)
+        counts = sum_file_counts(counted_files)
+        counts["errors"] = errors
+    else:
+        file_paths = find_source_files(directory)
+        if len(file_paths) >= parallel_threshold:
+            counts = count_files_in_parallel(file_paths, mode=mode)
+        else:
+            counts = count_files(file_paths, mode=mode)
+
+    if on_error is not None:
+        for file_path, message in counts["errors"]:
+            on_error(file_path, message)
+
+    return format_line_counts(counts)
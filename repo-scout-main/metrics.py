@@ -0,0 +1,208 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+# Stage timers and counters for the search -> clone -> count -> persist pipeline, kept for a whole run
+# and per repository, so a slow analysis can be traced to the GitHub API, git, the file walk or the
+# store. Exported as a dict, JSON or Prometheus text. Profiling is opt-in per run, with one
+# cProfile.Profile that profiled() blocks enable in turn. A profiler only sees the thread that enabled
+# it, and from Python 3.12 only one can be active per process, so profiled runs do their work in the
+# calling thread and profiled() blocks of all runs take turns.
+SEARCH = "search"
+CACHE_LOOKUP = "cache_lookup"
+CLONE = "clone"
+COUNT = "count"
+PERSIST = "persist"
+STAGES = (SEARCH, CACHE_LOOKUP, CLONE, COUNT, PERSIST)
+
+BYTES_CLONED = "bytes_cloned"
+FILES_SCANNED = "files_scanned"
+LINES_COUNTED = "lines_counted"
+CACHE_HITS = "cache_hits"
+CACHE_MISSES = "cache_misses"
+REPOSITORIES_FAILED = "repositories_failed"
+
+PROMETHEUS_PREFIX = "repo_scout"
+PROFILE_REPORT_LINES = 40
+
+# Held while any profiler is enabled
+_profiler_lock = threading.Lock()
+
+
+def directory_size(path):
+    # Bytes of all files below path, e.g. a fresh clone including its .git directory
+    total = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file))
+            except OSError:
+                continue
+    return total
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class RunMetrics:
+    def __init__(self, profile=False):
+        self.started_at = time.time()
+        self.finished_at = None
+        # stage -> [calls, total seconds, longest call in seconds]
+        self.stages = {}
+        # counter name -> value
+        self.counters = {}
+        # repository -> {"stages": {stage: seconds}, "counters": {name: value}}
+        self.repositories = {}
+        self._lock = threading.Lock()
+        self._profile = cProfile.Profile() if profile else None
+        self._profiled = False
+
+    @property
+    def profiling(self):
+        return self._profile is not None
+
+    def _repository(self, repository):
+        # Must be called with the lock held
+        return self.repositories.setdefault(repository, {"stages": {}, "counters": {}})
+
+    def record_time(self, stage, seconds, repository=None):
+        with self._lock:
+            calls, total, longest = self.stages.get(stage, (0, 0.0, 0.0))
+            self.stages[stage] = [calls + 1, total + seconds, max(longest, seconds)]
+            if repository is not None:
+                stages = self._repository(repository)["stages"]
+                stages[stage] = stages.get(stage, 0.0) + seconds
+
+    def increment(self, name, value=1, repository=None):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            if repository is not None:
+                counters = self._repository(repository)["counters"]
+                counters[name] = counters.get(name, 0) + value
+
+    @contextmanager
+    def timer(self, stage, repository=None):
+        # Records the block's duration under stage, also when it raises
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_time(stage, time.perf_counter() - start, repository)
+
+    @contextmanager
+    def profiled(self):
+        # Adds the calling thread's work during the block to the run's profile if it was created with
+        # profile=True; waits while another block is being profiled
+        if self._profile is None:
+            yield
+            return
+        with _profiler_lock:
+            self._profile.enable()
+            try:
+                yield
+            finally:
+                self._profile.disable()
+                self._profiled = True
+
+    def finish(self):
+        self.finished_at = time.time()
+
+    def summary(self):
+        # Rates derived from the stages and counters; None where there is nothing to divide by
+        with self._lock:
+            stages = {stage: list(values) for stage, values in self.stages.items()}
+            counters = dict(self.counters)
+        count_seconds = stages.get(COUNT, [0, 0.0, 0.0])[1]
+        clone_seconds = stages.get(CLONE, [0, 0.0, 0.0])[1]
+        search_calls, search_seconds, search_longest = stages.get(SEARCH, [0, 0.0, 0.0])
+        lookups = counters.get(CACHE_HITS, 0) + counters.get(CACHE_MISSES, 0)
+        return {
+            "wall_seconds": (self.finished_at or time.time()) - self.started_at,
+            "repositories": len(self.repositories),
+            "lines_per_second": counters.get(LINES_COUNTED, 0) / count_seconds if count_seconds else None,
+            "files_per_second": counters.get(FILES_SCANNED, 0) / count_seconds if count_seconds else None,
+            "clone_bytes_per_second": counters.get(BYTES_CLONED, 0) / clone_seconds if clone_seconds else None,
+            "cache_hit_rate": counters.get(CACHE_HITS, 0) / lookups if lookups else None,
+            "api_requests": search_calls,
+            "api_mean_latency_seconds": search_seconds / search_calls if search_calls else None,
+            "api_max_latency_seconds": search_longest if search_calls else None,
+        }
+
+    def to_dict(self):
+        summary = self.summary()
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "summary": summary,
+                "stages": {
+                    stage: {"calls": calls, "seconds": total, "max_seconds": longest}
+                    for stage, (calls, total, longest) in self.stages.items()
+                },
+                "counters": dict(self.counters),
+                "repositories": {
+                    repository: {"stages": dict(values["stages"]), "counters": dict(values["counters"])}
+                    for repository, values in self.repositories.items()
+                },
+            }
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def to_prometheus(self):
+        # Prometheus text exposition format, for a node_exporter textfile collector or a push gateway
+        data = self.to_dict()
+        lines = []
+
+        def metric(name, metric_type, help_text, samples):
+            if not samples:
+                return
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} {metric_type}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{_label(label)}"' for key, label in labels.items())
+                lines.append(f"{PROMETHEUS_PREFIX}_{name}{{{label_text}}} {value}" if label_text
+                             else f"{PROMETHEUS_PREFIX}_{name} {value}")
+
+        stages = data["stages"]
+        metric("stage_seconds_total", "counter", "Time spent in each pipeline stage.",
+               [({"stage": stage}, values["seconds"]) for stage, values in stages.items()])
+        metric("stage_calls_total", "counter", "Number of times each pipeline stage ran.",
+               [({"stage": stage}, values["calls"]) for stage, values in stages.items()])
+        metric("stage_max_seconds", "gauge", "Longest single run of each pipeline stage.",
+               [({"stage": stage}, values["max_seconds"]) for stage, values in stages.items()])
+        for name, value in sorted(data["counters"].items()):
+            metric(f"{name}_total", "counter", f"Total {name.replace('_', ' ')}.", [({}, value)])
+        metric("repository_stage_seconds", "gauge", "Time spent in each pipeline stage per repository.", [
+            ({"repository": repository, "stage": stage}, seconds)
+            for repository, values in data["repositories"].items()
+            for stage, seconds in values["stages"].items()
+        ])
+        for name, value in data["summary"].items():
+            if value is not None:
+                metric(name, "gauge", f"{name.replace('_', ' ').capitalize()} of the run.", [({}, value)])
+        return "\n".join(lines) + "\n"
+
+    def profile_stats(self, limit=PROFILE_REPORT_LINES, sort="cumulative"):
+        # pstats report of every profiled block, or None if nothing was profiled
+        if not self._profiled:
+            return None
+        stream = io.StringIO()
+        with _profiler_lock:
+            stats = pstats.Stats(self._profile, stream=stream)
+        stats.sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    def dump_profile(self, path):
+        # Writes the profile for snakeviz, `python -m pstats` and similar tools
+        if self._profiled:
+            with _profiler_lock:
+                stats = pstats.Stats(self._profile)
+            stats.dump_stats(path)
@@ -0,0 +1,71 @@
+from git import Repo
+
+import line_counter
+from languages import language_for_path
+from source_filter import HEADER_SIZE, RULE_FILES, SourceFilter, is_skipped_header
+
+# Counting straight from the object database of a bare clone: nothing is checked out,
+# so no source file is written to disk only to be read back and deleted.
+BARE_CLONE_OPTIONS = ["--bare", "--depth 1", "--single-branch"]
+
+
+def clone_bare(repo_url, git_dir):
+    Repo.clone_from(repo_url, git_dir, multi_options=BARE_CLONE_OPTIONS)
+
+
+def list_source_blobs(repo, revision="HEAD", source_filter=None):
+    # (blob sha, path) for every tracked file of a registered language that source_filter keeps, judged by
+    # path and size before any blob is read; submodules (commit entries) are skipped
+    if source_filter is None:
+        source_filter = SourceFilter()
+    output = repo.git.ls_tree("-r", "-z", "-l", "--full-tree", revision)
+    entries = []
+    for entry in output.split("\0"):
+        if not entry:
+            continue
+        info, path = entry.split("\t", 1)
+        _, object_type, sha, size = info.split()
+        if object_type == "blob":
+            entries.append((sha, path, int(size)))
+
+    # Parent directories' rule files first, so deeper ones override them
+    for sha, path, _ in sorted(entries, key=lambda entry: entry[1].count("/")):
+        if path.rpartition("/")[2] in RULE_FILES:
+            _, _, _, data = repo.git.get_object_data(sha)
+            source_filter.add_rule_file(path, data.decode('utf-8', errors='replace'))
+
+    return [
+        (sha, path) for sha, path, size in entries
+        if language_for_path(path) is not None and not source_filter.skips_path(path, size)
+    ]
+
+
+def count_blobs(repo, blobs):
+    # Blob contents are streamed through one persistent `git cat-file --batch` process
+    file_counts = {}
+    errors = []
+    for sha, path in blobs:
+        try:
+            _, _, _, data = repo.git.get_object_data(sha)
+            if is_skipped_header(data[:HEADER_SIZE]):
+                continue
+            file_counts[path] = list(line_counter.count_bytes(data, language_for_path(path)))
+        except UnicodeDecodeError:
+            continue
+        except Exception as e:
+            errors.append((path, str(e)))
+    return file_counts, errors
+
+
+def count_lines_of_code(git_dir, on_error=None, revision="HEAD"):
+    repo = Repo(git_dir)
+    try:
+        file_counts, errors = count_blobs(repo, list_source_blobs(repo, revision))
+    finally:
+        repo.close()
+
+    if on_error is not None:
+        for path, message in errors:
+            on_error(path, message)
+
+    return line_counter.format_line_counts(line_counter.sum_file_counts(file_counts))
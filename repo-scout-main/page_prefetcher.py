@@ -0,0 +1,62 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from result_cache import ResultCache
+
+# Search pages are kept by (query, per_page, page) in a ResultCache shared by every session, and the
+# neighbours of the page being viewed are fetched in the background so Next/Previous Page is instant.
+DEFAULT_MAX_PAGES = 256
+DEFAULT_MAX_AGE_SECONDS = 10 * 60
+DEFAULT_PREFETCH_WORKERS = 2
+
+_MISSING = object()
+
+
+class PagePrefetcher:
+    def __init__(self, client, cache=None, max_workers=DEFAULT_PREFETCH_WORKERS):
+        self.client = client
+        self.cache = cache if cache is not None else ResultCache(
+            "search", max_entries=DEFAULT_MAX_PAGES, ttl_seconds=DEFAULT_MAX_AGE_SECONDS
+        )
+        # (query, per_page, page) -> Future of a fetch that is still running
+        self._pending = {}
+        # Reentrant: a fetch that is already done runs its callback inside _start
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def _fetch(self, query, per_page, page):
+        return asyncio.run(self.client.search(query, page, per_page))
+
+    def _finish(self, key, future):
+        # Failed fetches are not cached, so the page is fetched again next time
+        if future.exception() is None:
+            self.cache.put(key, future.result())
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def _start(self, key):
+        # Must be called with the lock held; returns the running or newly started fetch of one page
+        future = self._pending.get(key)
+        if future is None:
+            future = self._pending[key] = self._executor.submit(self._fetch, *key)
+            future.add_done_callback(lambda done: self._finish(key, done))
+        return future
+
+    def get(self, query, page, per_page=50):
+        # Waits for the page if it is still loading; raises whatever the client raised
+        key = (query, per_page, page)
+        repositories = self.cache.get(key, _MISSING)
+        if repositories is not _MISSING:
+            return repositories
+        with self._lock:
+            future = self._start(key)
+        return future.result()
+
+    def prefetch(self, query, page, per_page=50):
+        # Starts loading page + 1 and page - 1 while page is on screen, unless they are cached
+        for neighbour in (page + 1, page - 1):
+            key = (query, per_page, neighbour)
+            if neighbour >= 1 and key not in self.cache:
+                with self._lock:
+                    self._start(key)
@@ -0,0 +1,448 @@
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+import pandas as pd
+from decouple import config
+from git import Repo
+
+import line_counter
+import object_store_analysis
+import sparse_clone
+from file_breakdown import BREAKDOWN_SUFFIX, breakdown_table, save_breakdown
+from analysis_cache import DEFAULT_CACHE_PATH, AnalysisCache, get_remote_head_sha, normalize_repo_url
+from github_client import GITHUB_API_URL, GitHubSearchClient
+from metrics import (BYTES_CLONED, CACHE_HITS, CACHE_LOOKUP, CACHE_MISSES, CLONE, COUNT, FILES_SCANNED, LINES_COUNTED,
+                     PERSIST, REPOSITORIES_FAILED, RunMetrics, directory_size)
+
+# Search, clone and count pipeline without any Streamlit imports, shared by app.py and the batch
+# command line:
+#   python repo_analysis.py --query "language:rust stars:>1000" --pages 3 --output results.parquet
+#   python repo_analysis.py --urls-file urls.txt --mode object-store --output results.jsonl
+# Functions taking metrics record their stage timings and counters in that RunMetrics.
+
+# Number of repositories cloned and counted at the same time
+DEFAULT_ANALYSIS_WORKERS = 4
+DEFAULT_CLONE_BASE_DIR = "./temp_cloned_repos"
+
+# How the repository is cloned and how its lines are counted
+WORKING_TREE_MODE = "working-tree"
+SPARSE_CHECKOUT_MODE = "sparse"
+OBJECT_STORE_MODE = "object-store"
+
+
+def shallow_clone(repo_url, clone_dir):
+    Repo.clone_from(repo_url, clone_dir, multi_options=["--depth 1"])
+
+
+ANALYSIS_MODES = {
+    WORKING_TREE_MODE: (shallow_clone, line_counter.count_lines_of_code),
+    SPARSE_CHECKOUT_MODE: (sparse_clone.clone_sparse, line_counter.count_lines_of_code),
+    OBJECT_STORE_MODE: (object_store_analysis.clone_bare, object_store_analysis.count_lines_of_code),
+}
+
+# Modes with a checkout, which per-file breakdowns are counted from
+BREAKDOWN_MODES = (WORKING_TREE_MODE, SPARSE_CHECKOUT_MODE)
+
+OUTPUT_FORMATS = ("csv", "jsonl", "parquet")
+
+
+def create_github_client(metrics=None):
+    # GITHUB_TOKEN (environment or .env) raises the rate limit, GITHUB_API_URL overrides the API address
+    return GitHubSearchClient(
+        token=config("GITHUB_TOKEN", default=None),
+        base_url=config("GITHUB_API_URL", default=GITHUB_API_URL),
+        metrics=metrics
+    )
+
+
+def search_repositories(client, query, pages=1, per_page=50):
+    # Fetches result pages 1..pages concurrently and returns their items in order
+    results = asyncio.run(client.search_pages(query, range(1, pages + 1), per_page))
+    return [repo for items in results for repo in items]
+
+
+def repository_from_url(url):
+    # Minimal repository record, in the shape of a search result, for a https://github.com/owner/name URL
+    url = url.strip().rstrip("/")
+    path = urlparse(url).path.strip("/")
+    if path.endswith(".git"):
+        path = path[:-len(".git")]
+    return {
+        'name': path.rsplit("/", 1)[-1],
+        'full_name': path,
+        'html_url': url[:-len(".git")] if url.endswith(".git") else url,
+        'clone_url': url,
+    }
+
+
+def basic_analysis_result(repo):
+    return {
+        "Name": repo['name'],
+        "Description": repo['description'],
+        "Stars": repo['stargazers_count'],
+        "Forks": repo['forks_count'],
+        "Language": repo['language'],
+        "Size (KB)": repo['size'],
+        "URL": repo['html_url'],  # Include repository URL
+        "Created At": repo['created_at'],
+        "Updated At": repo['updated_at'],
+        "Default Branch": repo['default_branch'],
+        "Open Issues": repo['open_issues'],
+        "Watchers": repo['watchers'],
+        "License": repo['license']['name'] if repo['license'] else None,
+    }
+
+
+def build_detailed_analysis_result(repo_name, line_counts):
+    result = {
+        "Name": repo_name,
+        "Total lines": line_counts['total_lines'],
+        "Total lines without spaces or comments": line_counts['total_lines_without_spaces_or_comments'],
+        "Java lines": line_counts['java_lines'],
+        "Python lines": line_counts['python_lines'],
+        "JavaScript lines": line_counts['javascript_lines'],
+        "Rust lines": line_counts['rust_lines'],
+        "CSS lines": line_counts['css_lines'],
+        "HTML lines": line_counts['html_lines'],
+        "Comment lines": line_counts['comment_lines'],
+        "Empty lines": line_counts['empty_lines']
+    }
+    # Then a column for every other language the repository has files of
+    for language_name, lines in line_counts.get('language_lines', {}).items():
+        result.setdefault(f"{language_name} lines", lines)
+    return result
+
+
+def fill_language_columns(df):
+    # Rows of repositories without a language's files have no value in its column; for analysed
+    # repositories that means 0 lines, only rows that failed or were not analysed stay empty
+    if "Total lines" not in df.columns:
+        return df
+    language_columns = [
+        column for column in df.columns
+        if column.endswith(" lines") and column not in ("Total lines", "Comment lines", "Empty lines")
+    ]
+    analysed = df["Total lines"].notna()
+    df = df.copy()
+    df.loc[analysed, language_columns] = df.loc[analysed, language_columns].fillna(0)
+    if analysed.all():
+        df[language_columns] = df[language_columns].astype(int)
+    return df
+
+
+def clone_repository(repo_url, clone_dir, clone=shallow_clone):
+    # Raises if the clone fails, leaving no partial clone behind
+    os.makedirs(clone_dir, exist_ok=True)
+    try:
+        clone(repo_url, clone_dir)
+    except Exception:
+        shutil.rmtree(clone_dir, ignore_errors=True)
+        raise
+
+
+def remote_head_sha(repo_url, metrics=None):
+    # The remote HEAD from git ls-remote, or None if the remote did not answer
+    if metrics is None:
+        metrics = RunMetrics()
+    try:
+        with metrics.timer(CACHE_LOOKUP, repo_url):
+            return get_remote_head_sha(repo_url)
+    except Exception:
+        return None
+
+
+def get_cached_line_counts(repo_url, cache, metrics=None, commit_sha=None):
+    # Checks the remote HEAD with git ls-remote so an unchanged repository needs no clone at all;
+    # commit_sha skips the ls-remote when the caller already asked
+    if metrics is None:
+        metrics = RunMetrics()
+    if commit_sha is None:
+        commit_sha = remote_head_sha(repo_url, metrics)
+    if commit_sha is None:
+        return None
+    line_counts = cache.get(repo_url, commit_sha)
+    # A miss is counted once the repository has been cloned and is actually counted
+    if line_counts is not None:
+        metrics.increment(CACHE_HITS, repository=repo_url)
+    return line_counts
+
+
+def count_lines_with_cache(repo_url, clone_dir, cache, count_lines, metrics=None):
+    # Keyed by the commit that was actually cloned, which may be newer than an earlier ls-remote answer
+    if metrics is None:
+        metrics = RunMetrics()
+    try:
+        commit_sha = Repo(clone_dir).head.commit.hexsha
+    except Exception:
+        metrics.increment(CACHE_MISSES, repository=repo_url)
+        return count_lines(clone_dir)
+
+    line_counts = cache.get(repo_url, commit_sha)
+    if line_counts is None:
+        metrics.increment(CACHE_MISSES, repository=repo_url)
+        line_counts = count_lines(clone_dir)
+        cache.put(repo_url, commit_sha, line_counts)
+    else:
+        metrics.increment(CACHE_HITS, repository=repo_url)
+    return line_counts
+
+
+def timed_count(count_lines, repo_url, metrics):
+    # Wraps count_lines(directory) to record the count stage, files scanned and lines counted
+    def count(directory):
+        with metrics.timer(COUNT, repo_url):
+            line_counts = count_lines(directory)
+        metrics.increment(FILES_SCANNED, line_counts.get('files_counted', 0), repo_url)
+        metrics.increment(LINES_COUNTED, line_counts['total_lines'], repo_url)
+        return line_counts
+    return count
+
+
+def timed_clone(clone, repo_url, metrics):
+    # Wraps clone(repo_url, clone_dir) to record the clone stage and the size of the clone on disk
+    def clone_and_measure(url, clone_dir):
+        with metrics.timer(CLONE, repo_url):
+            result = clone(url, clone_dir)
+        metrics.increment(BYTES_CLONED, directory_size(clone_dir), repo_url)
+        return result
+    return clone_and_measure
+
+
+def count_repository(repo_url, clone_dir, cache=None, mode=WORKING_TREE_MODE, on_error=None, metrics=None,
+                     breakdown_path=None, commit_sha=None):
+    # Line counts of a repository: from the cache for its current HEAD, or cloned, counted and cleaned up.
+    # With breakdown_path every file is counted and the per-file breakdown is saved there, so the cache
+    # is only written to.
+    if metrics is None:
+        metrics = RunMetrics()
+    if cache is not None and breakdown_path is None:
+        line_counts = get_cached_line_counts(repo_url, cache, metrics, commit_sha)
+        if line_counts is not None:
+            return line_counts
+
+    clone, count_lines_of_code = ANALYSIS_MODES[mode]
+    if breakdown_path is not None and mode not in BREAKDOWN_MODES:
+        raise ValueError(f"Per-file breakdowns need a checkout, use one of {', '.join(BREAKDOWN_MODES)}")
+    file_counts = {} if breakdown_path is not None else None
+
+    def count_lines_of_checkout(directory):
+        if file_counts is None:
+            return count_lines_of_code(directory, on_error=on_error)
+        return count_lines_of_code(directory, on_error=on_error, file_counts=file_counts)
+
+    count_lines = timed_count(count_lines_of_checkout, repo_url, metrics)
+    clone_repository(repo_url, clone_dir, clone=timed_clone(clone, repo_url, metrics))
+    try:
+        if breakdown_path is not None:
+            line_counts = count_lines(clone_dir)
+            commit_sha = Repo(clone_dir).head.commit.hexsha
+            with metrics.timer(PERSIST, repo_url):
+                save_breakdown(breakdown_path, breakdown_table(clone_dir, file_counts), commit_sha, line_counter.COUNTER_VERSION)
+            if cache is not None:
+                cache.put(repo_url, commit_sha, line_counts)
+            return line_counts
+        if cache is not None:
+            return count_lines_with_cache(repo_url, clone_dir, cache, count_lines, metrics)
+        return count_lines(clone_dir)
+    finally:
+        shutil.rmtree(clone_dir, ignore_errors=True)
+
+
+def analyze_repository(repo_name, repo_url, clone_dir, cache=None, mode=WORKING_TREE_MODE, on_error=None, metrics=None,
+                       shared_cache=None, breakdown_path=None):
+    # on_error(file_path, message) gets unreadable files. shared_cache is a ResultCache of line counts by
+    # (repository URL, remote HEAD): analyses of the same commit running at the same time, e.g. in
+    # different sessions, clone it once and share the result, and a push is seen at once. Without an
+    # answer from the remote the repository is counted without sharing.
+    if metrics is None:
+        metrics = RunMetrics()
+    commit_sha = remote_head_sha(repo_url, metrics) if shared_cache is not None else None
+    if commit_sha is None:
+        line_counts = count_repository(repo_url, clone_dir, cache, mode, on_error, metrics, breakdown_path)
+    else:
+        line_counts = shared_cache.get_or_compute(
+            (normalize_repo_url(repo_url), commit_sha),
+            lambda: count_repository(repo_url, clone_dir, cache, mode, on_error, metrics, breakdown_path, commit_sha)
+        )
+    return build_detailed_analysis_result(repo_name, line_counts)
+
+
+def analyze_repositories_concurrently(repositories, max_workers=DEFAULT_ANALYSIS_WORKERS, clone_base_dir=DEFAULT_CLONE_BASE_DIR,
+                                      cache=None, mode=WORKING_TREE_MODE, on_error=None, initializer=None, metrics=None,
+                                      shared_cache=None, breakdown_dir=None):
+    # Run analyze_repository on a bounded thread pool and yield (index, result, error) as each repository
+    # finishes; result is None when error is set. Cloning is network bound, so while some workers wait
+    # on git others are already counting. initializer runs once in every worker thread.
+    # A profiled run analyses one repository at a time in the calling thread, which the profiler can see.
+    def analyze(repo):
+        # full_name is unique, repo names alone can collide between owners
+        clone_dir = os.path.join(clone_base_dir, repo['full_name'].replace('/', '__'))
+        breakdown_path = None
+        if breakdown_dir is not None:
+            breakdown_path = os.path.join(breakdown_dir, os.path.basename(clone_dir) + BREAKDOWN_SUFFIX)
+        return analyze_repository(
+            repo['name'], repo['clone_url'], clone_dir, cache, mode, on_error, metrics, shared_cache, breakdown_path
+        )
+
+    def failed(index, error):
+        if metrics is not None:
+            metrics.increment(REPOSITORIES_FAILED, repository=repositories[index]['clone_url'])
+        return index, None, error
+
+    if metrics is not None and metrics.profiling:
+        for index, repo in enumerate(repositories):
+            try:
+                with metrics.profiled():
+                    result = analyze(repo)
+            except Exception as e:
+                yield failed(index, e)
+            else:
+                yield index, result, None
+        return
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, initializer=initializer)
+    try:
+        futures = {executor.submit(analyze, repo): index for index, repo in enumerate(repositories)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                yield failed(index, e)
+            else:
+                yield index, result, None
+    finally:
+        # When the caller stops early (e.g. a Streamlit rerun) repositories not started yet are dropped,
+        # and only the ones already running finish in the background
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def write_results(df, path, output_format=None):
+    # output_format defaults to the file extension: .csv, .jsonl or .parquet (needs pyarrow)
+    output_format = output_format or os.path.splitext(path)[1].lstrip(".").lower()
+    if output_format == "csv":
+        df.to_csv(path, index=False)
+    elif output_format == "jsonl":
+        df.to_json(path, orient="records", lines=True)
+    elif output_format == "parquet":
+        df.to_parquet(path, index=False)
+    else:
+        raise ValueError(f"Unsupported output format {output_format!r}, expected one of {', '.join(OUTPUT_FORMATS)}")
+
+
+def read_urls(path):
+    # One repository URL per line; blank lines and # comments are ignored, "-" reads stdin
+    stream = sys.stdin if path == "-" else open(path)
+    try:
+        return [line.strip() for line in stream if line.strip() and not line.lstrip().startswith("#")]
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def run_batch(repositories, max_workers=DEFAULT_ANALYSIS_WORKERS, clone_base_dir=DEFAULT_CLONE_BASE_DIR,
+              cache=None, mode=WORKING_TREE_MODE, on_error=None, on_progress=None, metrics=None, breakdown_dir=None):
+    # Analyses repositories and returns one row per repository in input order. Rows of search results
+    # carry the basic analysis columns too; failed repositories keep their row with the Error column set.
+    rows = [
+        basic_analysis_result(repo) if 'stargazers_count' in repo else {"Name": repo['name'], "URL": repo['html_url']}
+        for repo in repositories
+    ]
+    for row in rows:
+        row["Error"] = None
+
+    completed = 0
+    for index, result, error in analyze_repositories_concurrently(
+            repositories, max_workers=max_workers, clone_base_dir=clone_base_dir, cache=cache, mode=mode, on_error=on_error,
+            metrics=metrics, breakdown_dir=breakdown_dir):
+        completed += 1
+        if error is not None:
+            rows[index]["Error"] = str(error)
+        else:
+            rows[index].update(result)
+        if on_progress is not None:
+            on_progress(completed, len(repositories), repositories[index], error)
+    return fill_language_columns(pd.DataFrame(rows))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Clone and count lines of code for GitHub repositories without the UI.")
+    parser.add_argument("--query", help="GitHub repository search query")
+    parser.add_argument("--pages", type=int, default=1, help="number of search result pages to analyse")
+    parser.add_argument("--per-page", type=int, default=50, help="search results per page (at most 100)")
+    parser.add_argument("--url", action="append", default=[], help="repository URL to analyse, may be repeated")
+    parser.add_argument("--urls-file", help="file with one repository URL per line, - for stdin")
+    parser.add_argument("--output", required=True, help="result file, .csv, .jsonl or .parquet")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, help="output format, defaults to the --output extension")
+    parser.add_argument("--mode", choices=list(ANALYSIS_MODES), default=WORKING_TREE_MODE)
+    parser.add_argument("--workers", type=int, default=DEFAULT_ANALYSIS_WORKERS, help="repositories analysed at the same time")
+    parser.add_argument("--clone-dir", default=DEFAULT_CLONE_BASE_DIR, help="directory for temporary clones")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="analysis cache database shared with the app")
+    parser.add_argument("--no-cache", action="store_true", help="always clone and count")
+    parser.add_argument("--metrics", help="write stage timings and counters of the run to this JSON file")
+    parser.add_argument("--prometheus", help="write the same metrics in Prometheus text format to this file")
+    parser.add_argument("--profile", help="profile the run with cProfile and write the stats to this file")
+    parser.add_argument("--breakdown-dir", help=f"save per-file line counts of every repository here as <owner>__<name>{BREAKDOWN_SUFFIX}")
+    args = parser.parse_args(argv)
+
+    urls = list(args.url)
+    if args.urls_file:
+        urls += read_urls(args.urls_file)
+    if not args.query and not urls:
+        parser.error("give --query, --url or --urls-file")
+    if args.breakdown_dir:
+        if args.mode not in BREAKDOWN_MODES:
+            parser.error(f"--breakdown-dir needs --mode {' or '.join(BREAKDOWN_MODES)}")
+        os.makedirs(args.breakdown_dir, exist_ok=True)
+
+    metrics = RunMetrics(profile=args.profile is not None)
+    repositories = []
+    if args.query:
+        client = create_github_client(metrics)
+        try:
+            repositories += search_repositories(client, args.query, args.pages, args.per_page)
+        finally:
+            client.close()
+    seen = {repo['html_url'] for repo in repositories}
+    for url in urls:
+        repo = repository_from_url(url)
+        if repo['html_url'] not in seen:
+            seen.add(repo['html_url'])
+            repositories.append(repo)
+
+    def report_error(file_path, message):
+        print(f"Error reading file {file_path}: {message}", file=sys.stderr)
+
+    def report_progress(completed, total, repo, error):
+        status = f"failed: {error}" if error is not None else "done"
+        print(f"[{completed}/{total}] {repo['full_name']} {status}", file=sys.stderr)
+
+    df = run_batch(
+        repositories, max_workers=args.workers, clone_base_dir=args.clone_dir,
+        cache=None if args.no_cache else AnalysisCache(args.cache), mode=args.mode,
+        on_error=report_error, on_progress=report_progress, metrics=metrics, breakdown_dir=args.breakdown_dir
+    )
+    with metrics.timer(PERSIST):
+        write_results(df, args.output, args.format)
+    metrics.finish()
+    if args.metrics:
+        with open(args.metrics, 'w', encoding='utf-8') as f:
+            f.write(metrics.to_json())
+    if args.prometheus:
+        with open(args.prometheus, 'w', encoding='utf-8') as f:
+            f.write(metrics.to_prometheus())
+    if args.profile:
+        metrics.dump_profile(args.profile)
+
+    failed = int(df["Error"].notna().sum()) if not df.empty else 0
+    print(f"Wrote {len(df)} repositories to {args.output} ({failed} failed)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
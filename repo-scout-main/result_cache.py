@@ -0,0 +1,216 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from sqlite_connection import connect
+
+# In-memory LRU for results shared by every session of the server, bounded by entry count, total size and
+# age. Sizes are the length of the pickled value. With a spill_path, entries evicted for space are moved
+# to SQLite and read back from there until they expire; several caches can share one file. get_or_compute
+# runs compute once per key at a time: concurrent callers for the same key wait for that result.
+# Values are shared, so callers must not modify them.
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_MAX_BYTES = 64 << 20
+DEFAULT_TTL_SECONDS = 10 * 60
+# Spilled entries kept per cache, as a multiple of max_entries
+SPILL_FACTOR = 10
+
+_MISSING = object()
+
+
+class ResultCache:
+    def __init__(self, name, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES,
+                 ttl_seconds=DEFAULT_TTL_SECONDS, spill_path=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.spill_path = spill_path
+
+        # key -> (value, size in bytes, expires_at), least recently used first
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # key -> Future of a get_or_compute that is still running
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.spills = 0
+
+        if spill_path is not None:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS cache_entries ("
+                    " cache TEXT NOT NULL,"
+                    " key TEXT NOT NULL,"
+                    " value BLOB NOT NULL,"
+                    " expires_at REAL NOT NULL,"
+                    " PRIMARY KEY (cache, key))"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS cache_entries_expires_at ON cache_entries (cache, expires_at)")
+
+    def _connect(self):
+        return connect(self.spill_path)
+
+    def _get_entry(self, key, now):
+        # Must be called with the lock held
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[2] <= now:
+            self._remove(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _remove(self, key):
+        # Must be called with the lock held
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def _store(self, key, value, size, expires_at):
+        # Must be called with the lock held; returns the entries evicted to make room
+        self._remove(key)
+        self._entries[key] = (value, size, expires_at)
+        self._bytes += size
+        evicted = []
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            evicted_key, entry = self._entries.popitem(last=False)
+            self._bytes -= entry[1]
+            self.evictions += 1
+            evicted.append((evicted_key, entry[0], entry[2]))
+        return evicted
+
+    def _spill(self, entries):
+        if self.spill_path is None or not entries:
+            return
+        now = time.time()
+        rows = [
+            (self.name, repr(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires_at)
+            for key, value, expires_at in entries if expires_at > now
+        ]
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO cache_entries (cache, key, value, expires_at) VALUES (?, ?, ?, ?)", rows)
+            conn.execute("DELETE FROM cache_entries WHERE cache = ? AND expires_at <= ?", (self.name, now))
+            conn.execute(
+                "DELETE FROM cache_entries WHERE cache = ? AND rowid IN ("
+                " SELECT rowid FROM cache_entries WHERE cache = ? ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.name, self.name, self.max_entries * SPILL_FACTOR)
+            )
+        with self._lock:
+            self.spills += len(rows)
+
+    def _load(self, key, now):
+        # (value, expires_at) of a spilled entry, or None
+        if self.spill_path is None:
+            return None
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM cache_entries WHERE cache = ? AND key = ? AND expires_at > ?",
+                (self.name, repr(key), now)
+            ).fetchone()
+        if row is None:
+            return None
+        return pickle.loads(row[0]), row[1]
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            entry = self._get_entry(key, now)
+            if entry is not None:
+                self.hits += 1
+                return entry[0]
+
+        loaded = self._load(key, now)
+        with self._lock:
+            if loaded is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.disk_hits += 1
+            value, expires_at = loaded
+            evicted = self._store(key, value, len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)), expires_at)
+        self._spill(evicted)
+        return value
+
+    def __contains__(self, key):
+        # Like get, but without touching the statistics or the LRU order
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > now:
+                return True
+        return self._load(key, now) is not None
+
+    def put(self, key, value):
+        size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        with self._lock:
+            evicted = self._store(key, value, size, time.time() + self.ttl_seconds)
+        self._spill(evicted)
+
+    def get_or_compute(self, key, compute):
+        # The cached value of key, or compute() stored under key; exceptions are raised to every waiting caller
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        with self._lock:
+            future = self._pending.get(key)
+            computing = future is None
+            if computing:
+                future = self._pending[key] = Future()
+        if not computing:
+            return future.result()
+
+        # The pending entry is always dropped and the future always resolved, also when put fails
+        try:
+            value = compute()
+            # Stored before the pending future is dropped, so no caller misses both
+            self.put(key, value)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+        finally:
+            with self._lock:
+                del self._pending[key]
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._remove(key)
+        if self.spill_path is not None:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM cache_entries WHERE cache = ? AND key = ?", (self.name, repr(key)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.spill_path is not None:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM cache_entries WHERE cache = ?", (self.name,))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "cache": self.name,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "disk_hits": self.disk_hits,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "spills": self.spills,
+            }
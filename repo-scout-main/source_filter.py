@@ -0,0 +1,192 @@
+import os
+import re
+
+# Decides which files of a repository are worth counting before any of them is read: dependency,
+# build output and VCS directories are pruned from the walk, .gitignore rules and the
+# linguist-vendored / linguist-generated attributes of .gitattributes are honoured, and files
+# over a size cap, binary files and minified bundles are left out. Paths are relative to the
+# repository root and use "/" like git does.
+
+# Directories that are never descended into
+PRUNED_DIRECTORIES = frozenset({
+    ".git", ".hg", ".svn", "node_modules", "bower_components", "jspm_packages", "vendor", "third_party",
+    "dist", "__pycache__", ".venv", "venv", ".tox", ".mypy_cache", ".pytest_cache", "site-packages",
+})
+# Bundled or generated files recognised by their name
+GENERATED_FILE_PATTERNS = (
+    "*.min.js", "*.min.css", "*-min.js", "*.bundle.js", "*.chunk.js", "*.pb.go", "*_pb2.py", "*.designer.cs",
+)
+# Larger files are almost always generated or vendored data
+DEFAULT_MAX_FILE_SIZE = 1 << 20
+# Like git, a file with a NUL byte in its first 8000 bytes is binary
+HEADER_SIZE = 8000
+# A full header with a longer average line than this is a minified bundle, not hand-written source
+MINIFIED_LINE_LENGTH = 500
+IGNORE_FILE = ".gitignore"
+ATTRIBUTES_FILE = ".gitattributes"
+RULE_FILES = (IGNORE_FILE, ATTRIBUTES_FILE)
+LINGUIST_ATTRIBUTES = ("linguist-vendored", "linguist-generated")
+
+
+def _glob_regex(pattern):
+    # Regex for a .gitignore / .gitattributes pattern, matched against paths relative to the
+    # directory of the file it comes from. A pattern without a slash matches at any depth.
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    parts = [] if anchored else ["(?:.*/)?"]
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2:]:
+            end = pattern.index("]", i + 2)
+            characters = pattern[i + 1:end].replace("\\", "\\\\")
+            if characters.startswith("!"):
+                characters = "^" + characters[1:]
+            parts.append(f"[{characters}]")
+            i = end + 1
+        elif pattern[i] == "\\" and i + 1 < len(pattern):
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return re.compile("".join(parts), re.DOTALL)
+
+
+def _relative_to(path, base):
+    # path relative to base, or None if it is not inside it
+    if not base:
+        return path
+    if path.startswith(base + "/"):
+        return path[len(base) + 1:]
+    return None
+
+
+def is_skipped_header(header):
+    # header is the first HEADER_SIZE bytes of a file
+    if b"\0" in header:
+        return True
+    # CR-only line endings count too, like they do for the line counter
+    line_breaks = max(header.count(b"\n"), header.count(b"\r"))
+    return len(header) >= HEADER_SIZE and line_breaks * MINIFIED_LINE_LENGTH < len(header)
+
+
+def read_header(file_path):
+    with open(file_path, 'rb') as f:
+        return f.read(HEADER_SIZE)
+
+
+class SourceFilter:
+    def __init__(self, max_file_size=DEFAULT_MAX_FILE_SIZE):
+        self.max_file_size = max_file_size
+        # (base directory, regex, negated, directories only), in the order git applies them: later
+        # rules and rules from deeper directories win
+        self.ignore_rules = []
+        # (base directory, regex, excluded) for the linguist attributes
+        self.attribute_rules = []
+        self.generated_files = [_glob_regex(pattern) for pattern in GENERATED_FILE_PATTERNS]
+
+    def add_ignore_file(self, base, text):
+        for line in text.splitlines():
+            line = line.rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negated = line.startswith("!")
+            if negated:
+                line = line[1:]
+            directories_only = line.endswith("/")
+            line = line.rstrip("/")
+            if line:
+                self.ignore_rules.append((base, _glob_regex(line), negated, directories_only))
+
+    def add_attributes_file(self, base, text):
+        for line in text.splitlines():
+            fields = line.split()
+            # Quoted patterns and macro definitions are not supported
+            if not fields or fields[0].startswith(("#", '"', "[attr]")):
+                continue
+            for attribute in fields[1:]:
+                name, _, value = attribute.lstrip("-!").partition("=")
+                if name in LINGUIST_ATTRIBUTES:
+                    excluded = not attribute.startswith(("-", "!")) and value in ("", "true")
+                    self.attribute_rules.append((base, _glob_regex(fields[0]), excluded))
+
+    def add_rule_file(self, path, text):
+        # path is a .gitignore or .gitattributes file of the repository
+        base, _, name = path.rpartition("/")
+        if name == IGNORE_FILE:
+            self.add_ignore_file(base, text)
+        elif name == ATTRIBUTES_FILE:
+            self.add_attributes_file(base, text)
+
+    def _is_ignored(self, path, is_directory):
+        ignored = False
+        for base, regex, negated, directories_only in self.ignore_rules:
+            relative_path = _relative_to(path, base)
+            if relative_path is None or (directories_only and not is_directory):
+                continue
+            if regex.fullmatch(relative_path):
+                ignored = not negated
+        return ignored
+
+    def skips_directory(self, path):
+        return path.rpartition("/")[2] in PRUNED_DIRECTORIES or self._is_ignored(path, True)
+
+    def skips_file(self, path, size=None):
+        # Everything that can be decided from the path and size; the header is checked separately
+        if self.max_file_size is not None and size is not None and size > self.max_file_size:
+            return True
+        if any(regex.fullmatch(path) for regex in self.generated_files):
+            return True
+        if self._is_ignored(path, False):
+            return True
+        excluded = False
+        for base, regex, excluded_by_rule in self.attribute_rules:
+            relative_path = _relative_to(path, base)
+            if relative_path is not None and regex.fullmatch(relative_path):
+                excluded = excluded_by_rule
+        return excluded
+
+    def skips_file_on_disk(self, file_path, path, check_directories=False):
+        # skips_file plus the size and header of the file at file_path; with check_directories the
+        # directories above path are checked too. Unreadable files are kept for the counter to report.
+        try:
+            size = os.path.getsize(file_path)
+            if self.skips_path(path, size) if check_directories else self.skips_file(path, size):
+                return True
+            return is_skipped_header(read_header(file_path))
+        except OSError:
+            return False
+
+    def skips_path(self, path, size=None):
+        # skips_file for a path from a flat listing, which also checks every directory above it
+        directory = ""
+        for name in path.split("/")[:-1]:
+            directory = f"{directory}/{name}" if directory else name
+            if self.skips_directory(directory):
+                return True
+        return self.skips_file(path, size)
+
+
+def load_rule_files(source_filter, directory, relative_paths):
+    # Adds the .gitignore and .gitattributes files among relative_paths, read from directory
+    rule_paths = [path for path in relative_paths if path.rpartition("/")[2] in RULE_FILES]
+    # Parent directories first, so deeper files override them
+    for path in sorted(rule_paths, key=lambda path: path.count("/")):
+        try:
+            with open(os.path.join(directory, path), 'r', encoding='utf-8', errors='replace') as f:
+                source_filter.add_rule_file(path, f.read())
+        except OSError:
+            continue
+    return source_filter
@@ -0,0 +1,24 @@
+from git import Repo
+
+from languages import SOURCE_EXTENSIONS, SOURCE_FILENAMES
+from source_filter import GENERATED_FILE_PATTERNS, PRUNED_DIRECTORIES, RULE_FILES
+
+# A partial clone that downloads trees but no blobs, then checks out only the files
+# count_lines_of_code reads, so media, datasets and other assets are never fetched.
+SPARSE_CLONE_OPTIONS = ["--depth 1", "--filter=blob:none", "--no-checkout", "--single-branch"]
+
+
+def sparse_checkout_patterns(extensions=SOURCE_EXTENSIONS, filenames=SOURCE_FILENAMES):
+    # Non-cone patterns without a slash match at any depth, like .gitignore entries. The rule files are
+    # checked out for find_source_files, and the directories and files it would skip are never fetched.
+    patterns = [f"*{extension}" for extension in extensions] + list(filenames) + list(RULE_FILES)
+    patterns += [f"!**/{name}/**" for name in sorted(PRUNED_DIRECTORIES)]
+    return patterns + [f"!{pattern}" for pattern in GENERATED_FILE_PATTERNS]
+
+
+def clone_sparse(repo_url, clone_dir, extensions=SOURCE_EXTENSIONS, filenames=SOURCE_FILENAMES):
+    repo = Repo.clone_from(repo_url, clone_dir, multi_options=SPARSE_CLONE_OPTIONS)
+    repo.git.sparse_checkout("set", "--no-cone", *sparse_checkout_patterns(extensions, filenames))
+    # The checkout fetches the missing blobs it needs in a single batch
+    repo.git.checkout()
+    return repo
@@ -0,0 +1,23 @@
+import sqlite3
+from contextlib import closing
+
+
+class ClosingConnection:
+    # sqlite3's own context manager commits but never closes the connection
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        with closing(self.conn):
+            if exc_type is None:
+                self.conn.commit()
+            else:
+                self.conn.rollback()
+
+
+def connect(path, timeout=30):
+    # A short-lived connection per call keeps stores safe to share between threads and sessions
+    return ClosingConnection(sqlite3.connect(path, timeout=timeout))
@@ -0,0 +1,152 @@
+import os
+import sys
+from functools import partial
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import line_counter  # noqa: E402
+
+# The byte-level counter ("bytes" mode) must give the same totals as decoding each file ("text" mode).
+# Fixture trees cover line endings, BOMs, Unicode whitespace, undecodable files and comments or strings
+# that span lines. Small chunk sizes cut every construct at a chunk boundary somewhere.
+CHUNK_SIZES = [1, 2, 3, 7, 64, line_counter.READ_CHUNK_SIZE]
+
+C_SOURCE = (
+    "/*\n"
+    " * Block comment\n"
+    " */\n"
+    "int main(void) {\n"
+    "    int a = 1; /* inline */ int b = 2;\n"
+    "    /* one line */\n"
+    "    char *s = \"not /* a comment\";\n"
+    "    // line comment\n"
+    "\n"
+    "    return a /* spans\n"
+    "    lines */ + b;\n"
+    "}\n"
+)
+PYTHON_SOURCE = (
+    "import os\n"
+    "\n"
+    "def f():\n"
+    '    """\n'
+    "    Docstring with a # inside.\n"
+    '    """\n'
+    "    value = '# not a comment'  # trailing comment\n"
+    "    # comment\n"
+    "    return '''a\n"
+    "b'''\n"
+)
+JAVASCRIPT_SOURCE = (
+    "const a = `template\n"
+    "// still a string\n"
+    "${value}`;\n"
+    "/** JSDoc\n"
+    " * line\n"
+    " */\n"
+    "call(value /* inline */, other);\n"
+    "const b = `x` + `y`;\n"
+    "const c = `a` + '`' + `b`;\n"
+    "f(`a`); // `c\n"
+    "const d = `a\\`b` + `c`;\n"
+    "const e = `open` + `still\n"
+    "open`;\n"
+)
+HTML_SOURCE = "<html>\n<!-- comment\nstill comment -->\n<body></body>\n</html>\n"
+UNICODE_WHITESPACE = ["\u00a0", "\u2003", "\u3000", "\u200b", "\u2028", "\u2029", "\u0085", "\x0b", "\x0c", "\x1c", "\x1f"]
+
+SOURCES = {
+    "main.c": C_SOURCE,
+    "pkg/module.py": PYTHON_SOURCE,
+    "web/app.js": JAVASCRIPT_SOURCE,
+    "web/index.html": HTML_SOURCE,
+    "lib/lib.rs": "fn main() {\n    let s = \"a // b\";\n    // comment\n}\n",
+    "notes.txt": "plain text\n\n  indented\n",
+}
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def write_fixture_tree(directory):
+    for relative_path, source in SOURCES.items():
+        stem, extension = os.path.splitext(relative_path)
+        encoded = source.encode()
+        write_file(os.path.join(directory, relative_path), encoded)
+        # Line ending variants, with and without a final line break
+        write_file(os.path.join(directory, f"{stem}_crlf{extension}"), encoded.replace(b"\n", b"\r\n"))
+        write_file(os.path.join(directory, f"{stem}_cr{extension}"), encoded.replace(b"\n", b"\r"))
+        write_file(os.path.join(directory, f"{stem}_nofinal{extension}"), encoded.rstrip(b"\n"))
+        mixed = b"".join(
+            line + (b"\r\n", b"\n", b"\r")[i % 3]
+            for i, line in enumerate(encoded.split(b"\n")[:-1])
+        )
+        write_file(os.path.join(directory, f"{stem}_mixed{extension}"), mixed)
+        write_file(os.path.join(directory, f"{stem}_bom{extension}"), b"\xef\xbb\xbf" + encoded)
+
+    # Lines of Unicode whitespace only, and code indented or followed by it
+    whitespace = "".join(f"{char}\n{char}x = 1{char}\n  {char}  \n" for char in UNICODE_WHITESPACE)
+    write_file(os.path.join(directory, "unicode/whitespace.py"), whitespace.encode())
+    write_file(os.path.join(directory, "unicode/whitespace.c"), ("/*" + whitespace + "*/\n" + whitespace).encode())
+    write_file(os.path.join(directory, "unicode/text.js"), "const s = 'héllo wörld ✓ 𝄞';\n// ✓ ✓\n\n".encode())
+    write_file(os.path.join(directory, "unicode/bom_only.py"), b"\xef\xbb\xbf")
+    write_file(os.path.join(directory, "empty.py"), b"")
+    write_file(os.path.join(directory, "newlines.py"), b"\n\r\n\r\r\n\n")
+
+    # Not UTF-8: skipped in both modes, wherever the bad byte is
+    write_file(os.path.join(directory, "invalid/latin1.py"), "x = 'café'\n".encode("latin-1"))
+    write_file(os.path.join(directory, "invalid/late.c"), C_SOURCE.encode() * 3 + b"int x = 0; /* \xff */\n")
+    write_file(os.path.join(directory, "invalid/truncated.js"), "const s = '✓';\n".encode()[:-4] + b"\n")
+
+    # Multi-byte characters and block comments repeated so they cross chunk boundaries at every offset
+    write_file(os.path.join(directory, "long/long.c"), ("/* ✓ */ int ä;\r\n" * 50 + C_SOURCE * 20).encode())
+    write_file(os.path.join(directory, "long/long.py"), (PYTHON_SOURCE * 30 + "x = '𝄞'\n" * 40).encode())
+    write_file(os.path.join(directory, "long/long.js"), (JAVASCRIPT_SOURCE * 60 + "const t = `${a}`;\n" * 200).encode())
+
+
+@pytest.fixture(scope="module")
+def fixture_tree(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp("parity"))
+    write_fixture_tree(directory)
+    return directory
+
+
+def count_in_process(directory, mode, **kwargs):
+    # parallel_threshold keeps the files in this process, where the patched counter is used
+    return line_counter.count_lines_of_code(directory, parallel_threshold=sys.maxsize, mode=mode, **kwargs)
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_count_lines_of_code_bytes_matches_text(fixture_tree, monkeypatch, chunk_size):
+    monkeypatch.setitem(line_counter.COUNT_MODES, "bytes", partial(line_counter.count_file_bytes, chunk_size=chunk_size))
+    expected = count_in_process(fixture_tree, "text")
+    assert expected["files_counted"] > 0
+    assert count_in_process(fixture_tree, "bytes") == expected
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_file_counts_bytes_match_text(fixture_tree, monkeypatch, chunk_size):
+    monkeypatch.setitem(line_counter.COUNT_MODES, "bytes", partial(line_counter.count_file_bytes, chunk_size=chunk_size))
+    text_file_counts = {}
+    bytes_file_counts = {}
+    count_in_process(fixture_tree, "text", file_counts=text_file_counts)
+    count_in_process(fixture_tree, "bytes", file_counts=bytes_file_counts)
+    assert bytes_file_counts == text_file_counts
+    assert not any(path.startswith("invalid/") for path in text_file_counts)
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_count_file_bytes_matches_count_file(fixture_tree, chunk_size):
+    for file_path in line_counter.find_source_files(fixture_tree):
+        try:
+            expected = line_counter.count_file(file_path)
+        except UnicodeDecodeError:
+            with pytest.raises(UnicodeDecodeError):
+                line_counter.count_file_bytes(file_path, chunk_size=chunk_size)
+            continue
+        assert line_counter.count_file_bytes(file_path, chunk_size=chunk_size) == expected, file_path